@@ -0,0 +1,6 @@
+"""
+Performance benchmarks for the Pet service
+
+These are not run with the unit tests. Run each one as a module, e.g.:
+    python -m benchmarks.startup
+"""
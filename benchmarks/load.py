@@ -0,0 +1,337 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Load Benchmark
+
+Seeds the database with Pets and replays a seeded, repeatable mix of
+requests against the service, then reports the latency percentiles and
+throughput and compares them with a baseline. It exits with status 1
+when any of them regressed by more than the tolerance.
+
+Requests are sent in-process through the Flask test client, or over HTTP
+to a running service with --url. That service must use the same
+DATABASE_URI as the benchmark, which seeds it.
+
+Usage:
+    python -m benchmarks.load [--pets 10000] [--requests 2000]
+    python -m benchmarks.load --mix list=1,get=4,purchase=1
+    python -m benchmarks.load --update-baseline
+    DATABASE_URI=postgresql://... python -m benchmarks.load
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import factory.random
+
+TMP_DIR = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+os.environ.setdefault("DATABASE_URI", f"sqlite:///{TMP_DIR.name}/load.db")
+
+# pylint: disable=wrong-import-position
+from service import app  # noqa: E402
+from service.models import Pet, PetStats, db, cache, create_tables  # noqa: E402
+from tests.factories import PetFactory  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+DEFAULT_MIX = "list=15,filtered=25,get=35,create=10,update=10,purchase=5"
+
+# Fraction a result may be worse than the baseline before it is a regression
+DEFAULT_TOLERANCE = 0.25
+
+
+######################################################################
+# C L I E N T S
+######################################################################
+class InProcessClient:
+    """Sends requests to the app through the Flask test client"""
+
+    def __init__(self):
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, body: dict = None) -> int:
+        """Sends a request and returns the status code"""
+        response = self.client.open(path, method=method, json=body)
+        response.close()
+        return response.status_code
+
+
+class HttpClient:
+    """Sends requests to a running service over one keep-alive connection"""
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+
+    def request(self, method: str, path: str, body: dict = None) -> int:
+        """Sends a request and returns the status code"""
+        headers = {}
+        data = None
+        if body is not None:
+            data = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        self.connection.request(method, path, body=data, headers=headers)
+        response = self.connection.getresponse()
+        response.read()
+        return response.status
+
+
+######################################################################
+# R E Q U E S T   M I X
+######################################################################
+# Each operation returns the request to send and the status codes it may
+# return. Purchases of Pets that were already bought return 409.
+def list_request(rng, ids):  # pylint: disable=unused-argument
+    """A page of every Pet"""
+    return "GET", "/pets?limit=100", None, {200}
+
+
+def filtered_request(rng, ids):  # pylint: disable=unused-argument
+    """A page of the Pets of one category that are available"""
+    category = rng.choice(["dog", "cat", "bird", "fish"])
+    return "GET", f"/pets?category={category}&available=true&limit=100", None, {200}
+
+
+def get_request(rng, ids):
+    """One Pet by id"""
+    return "GET", f"/pets/{rng.choice(ids)}", None, {200}
+
+
+def create_request(rng, ids):  # pylint: disable=unused-argument
+    """A new Pet"""
+    return "POST", "/pets", PetFactory().serialize(), {201}
+
+
+def update_request(rng, ids):
+    """New data for one Pet"""
+    return "PUT", f"/pets/{rng.choice(ids)}", PetFactory().serialize(), {200}
+
+
+def purchase_request(rng, ids):
+    """The purchase of one Pet"""
+    return "PUT", f"/pets/{rng.choice(ids)}/purchase", None, {200, 409}
+
+
+OPERATIONS = {
+    "list": list_request,
+    "filtered": filtered_request,
+    "get": get_request,
+    "create": create_request,
+    "update": update_request,
+    "purchase": purchase_request,
+}
+
+
+def parse_mix(mix: str) -> dict:
+    """Parses a mix like 'list=1,get=4' into the weight of each operation"""
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}, use {', '.join(OPERATIONS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def make_schedule(weights: dict, count: int, seed: int, ids: list) -> list:
+    """Returns the requests to send, the same ones every time for the same seed"""
+    rng = random.Random(seed)
+    factory.random.reseed_random(seed)
+    names = rng.choices(list(weights), weights=list(weights.values()), k=count)
+    return [(name, *OPERATIONS[name](rng, ids)) for name in names]
+
+
+######################################################################
+# R U N
+######################################################################
+def seed_pets(count: int, seed: int) -> list:
+    """Replaces the Pets in the database with count new ones and returns their ids"""
+    factory.random.reseed_random(seed)
+    with app.app_context():
+        create_tables()
+        db.session.query(Pet).delete()
+        db.session.query(PetStats).delete()
+        db.session.commit()
+        pets = Pet.create_many(PetFactory.build_batch(count), chunk_size=app.config["BULK_CHUNK_SIZE"])
+        db.session.remove()
+    cache.clear()
+    return [pet.id for pet in pets]
+
+
+def send(client, request: tuple) -> tuple:
+    """Sends one scheduled request and returns its operation, latency and if it failed"""
+    name, method, path, body, expected = request
+    start = time.perf_counter()
+    code = client.request(method, path, body)
+    return name, time.perf_counter() - start, code not in expected
+
+
+def replay(make_client, schedule: list, concurrency: int) -> tuple:
+    """Sends the scheduled requests and returns the samples and the wall time"""
+    if concurrency == 1:
+        client = make_client()
+        start = time.perf_counter()
+        samples = [send(client, request) for request in schedule]
+        return samples, time.perf_counter() - start
+
+    # each thread keeps its own client so connections are not shared
+    local = threading.local()
+
+    def send_from_thread(request):
+        if not hasattr(local, "client"):
+            local.client = make_client()
+        return send(local.client, request)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        samples = list(executor.map(send_from_thread, schedule))
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """Returns the latency percentiles in milliseconds and throughput of each operation"""
+    groups = {"all": samples}
+    for sample in samples:
+        groups.setdefault(sample[0], []).append(sample)
+
+    results = {}
+    for name, group in groups.items():
+        latencies = sorted(latency * 1000 for _, latency, _ in group)
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+        results[name] = {
+            "requests": len(group),
+            "errors": sum(1 for _, _, failed in group if failed),
+            "p50_ms": round(percentiles[49], 3),
+            "p95_ms": round(percentiles[94], 3),
+            "p99_ms": round(percentiles[98], 3),
+            "throughput_rps": round(len(group) / elapsed, 1),
+        }
+    return results
+
+
+######################################################################
+# R E P O R T
+######################################################################
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns a message for every result that regressed against the baseline"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ["p50_ms", "p95_ms", "p99_ms"]:
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name} {key} {result[key]:.2f} > baseline {base[key]:.2f}")
+        if result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name} throughput_rps {result['throughput_rps']:.1f} < baseline {base['throughput_rps']:.1f}"
+            )
+        if result["errors"] > base["errors"]:
+            regressions.append(f"{name} errors {result['errors']} > baseline {base['errors']}")
+    return regressions
+
+
+def print_report(results: dict, baseline: dict) -> None:
+    """Prints the results next to the baseline"""
+    print(f"{'operation':<10}{'requests':>9}{'errors':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>10}")
+    for name, result in results.items():
+        print(
+            f"{name:<10}{result['requests']:>9}{result['errors']:>7}{result['p50_ms']:>9.2f}"
+            f"{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['throughput_rps']:>10.1f}"
+        )
+        base = baseline.get(name)
+        if base:
+            print(
+                f"{'  baseline':<26}{base['p50_ms']:>9.2f}{base['p95_ms']:>9.2f}"
+                f"{base['p99_ms']:>9.2f}{base['throughput_rps']:>10.1f}"
+            )
+
+
+def load_baseline(path: str, settings: dict) -> dict:
+    """Returns the baseline results if they were recorded with the same settings"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline["settings"] != settings:
+        print(f"Baseline was recorded with {baseline['settings']}, not comparing", file=sys.stderr)
+        return {}
+    return baseline["results"]
+
+
+def main():
+    """Runs the load benchmark, prints a report and fails on regressions"""
+    parser = argparse.ArgumentParser(description="Replay a request mix and compare it with a baseline")
+    parser.add_argument("--pets", type=int, default=10_000, help="number of Pets to seed")
+    parser.add_argument("--requests", type=int, default=2_000, help="number of requests to replay")
+    parser.add_argument("--warmup", type=int, default=200, help="requests sent before measuring")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help=f"default: {DEFAULT_MIX}")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=1, help="number of requests in flight")
+    parser.add_argument("--url", help="send the requests to a running service at this url")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true", help="record these results as the baseline")
+    args = parser.parse_args()
+
+    settings = {
+        "pets": args.pets,
+        "requests": args.requests,
+        "mix": args.mix,
+        "seed": args.seed,
+        "concurrency": args.concurrency,
+    }
+    ids = seed_pets(args.pets, args.seed)
+    schedule = make_schedule(args.mix, args.warmup + args.requests, args.seed, ids)
+
+    def make_client():
+        return HttpClient(args.url) if args.url else InProcessClient()
+
+    replay(make_client, schedule[:args.warmup], args.concurrency)
+    samples, elapsed = replay(make_client, schedule[args.warmup:], args.concurrency)
+    results = summarize(samples, elapsed)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump({"settings": settings, "results": results}, baseline_file, indent=2)
+            baseline_file.write("\n")
+        print_report(results, {})
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    baseline = load_baseline(args.baseline, settings)
+    print_report(results, baseline)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\nREGRESSION: {len(regressions)} result(s) worse than the baseline by more than {args.tolerance:.0%}")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("\nNo regressions" if baseline else "\nNo baseline to compare with")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Name Search Benchmark
+
+Seeds the database with a large number of Pets and times prefix and fuzzy
+name searches through Pet.search_by_name(), reporting the latency
+percentiles of each. On SQLite the time to build the in-process name
+index is reported separately since it is only paid once per process.
+
+Usage:
+    python -m benchmarks.search [--rows 1000000] [--names 50000]
+    DATABASE_URI=postgresql://... python -m benchmarks.search
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from faker.providers.person.en_US import Provider as PersonProvider
+
+TMP_DIR = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+os.environ.setdefault("DATABASE_URI", f"sqlite:///{TMP_DIR.name}/search.db")
+
+# pylint: disable=wrong-import-position
+from service import app  # noqa: E402
+from service.models import Gender, Pet, PetStats, db, name_index, create_tables, create_indexes  # noqa: E402
+
+CATEGORIES = ["dog", "cat", "bird", "fish", "rabbit", "hamster"]
+
+
+def make_names(count: int, rng: random.Random) -> list:
+    """Returns up to count distinct names: every first name and then first and last names"""
+    first_names = sorted(set(PersonProvider.first_names))
+    last_names = sorted(set(PersonProvider.last_names))
+    count = min(count, len(first_names) * (len(last_names) + 1))
+    names = set(first_names[:count])
+    while len(names) < count:
+        names.add(f"{rng.choice(first_names)} {rng.choice(last_names)}")
+    return sorted(names)
+
+
+def seed(rows: int, names: list, rng: random.Random) -> None:
+    """Replaces the Pets in the database with rows new ones using bulk inserts"""
+    db.session.query(Pet).delete()
+    db.session.query(PetStats).delete()
+    db.session.commit()
+    genders = list(Gender)
+    chunk_size = 10_000
+    # the bulk inserts are expected to be slow, so keep them out of the slow query log
+    threshold = app.config["SLOW_QUERY_THRESHOLD_MS"]
+    app.config["SLOW_QUERY_THRESHOLD_MS"] = float("inf")
+    for start in range(0, rows, chunk_size):
+        db.session.execute(
+            Pet.__table__.insert(),
+            [
+                {
+                    "name": rng.choice(names),
+                    "category": rng.choice(CATEGORIES),
+                    "available": rng.random() < 0.5,
+                    "gender": rng.choice(genders),
+                    "version": 1,
+                }
+                for _ in range(min(chunk_size, rows - start))
+            ],
+        )
+    db.session.commit()
+    PetStats.rebuild()
+    app.config["SLOW_QUERY_THRESHOLD_MS"] = threshold
+    name_index.clear()
+
+
+def misspell(name: str, rng: random.Random) -> str:
+    """Returns the first word of a name with one letter dropped or swapped"""
+    word = name.split()[0]
+    i = rng.randrange(len(word) - 1)
+    if rng.random() < 0.5:
+        return word[:i] + word[i + 1:]
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def time_searches(queries: list, fuzzy: bool, limit: int) -> dict:
+    """Returns the latency percentiles in milliseconds of each search"""
+    latencies = []
+    matches = 0
+    for text in queries:
+        start = time.perf_counter()
+        matches += len(Pet.search_by_name(text, fuzzy=fuzzy, limit=limit))
+        latencies.append((time.perf_counter() - start) * 1000)
+        db.session.remove()
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "p50": percentiles[49],
+        "p95": percentiles[94],
+        "p99": percentiles[98],
+        "matches": matches / len(queries),
+    }
+
+
+def main():
+    """Runs the name search benchmark and prints a report"""
+    parser = argparse.ArgumentParser(description="Time prefix and fuzzy name search")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="number of Pets to seed")
+    parser.add_argument("--names", type=int, default=50_000, help="number of distinct names")
+    parser.add_argument("--searches", type=int, default=500, help="number of searches of each kind")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with app.app_context():
+        create_tables()
+        create_indexes()
+        backend = db.engine.dialect.name
+        names = make_names(args.names, rng)
+        start = time.perf_counter()
+        seed(args.rows, names, rng)
+        print(f"Seeded {args.rows:,} Pets with {len(names):,} names on {backend} in {time.perf_counter() - start:.1f}s")
+
+        if backend != "postgresql":
+            start = time.perf_counter()
+            Pet.search_by_name("a")
+            print(f"Built the name index in {time.perf_counter() - start:.2f}s")
+
+        searches = {
+            "prefix": ([rng.choice(names)[:rng.randint(1, 3)] for _ in range(args.searches)], False),
+            "fuzzy": ([misspell(rng.choice(names), rng) for _ in range(args.searches)], True),
+        }
+        print(f"\n{'search':<8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'matches':>9}")
+        for kind, (queries, fuzzy) in searches.items():
+            result = time_searches(queries, fuzzy, args.limit)
+            print(
+                f"{kind:<8}{result['p50']:>9.2f}{result['p95']:>9.2f}{result['p99']:>9.2f}{result['matches']:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
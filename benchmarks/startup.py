@@ -0,0 +1,87 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Startup Benchmark
+
+Measures how long a fresh worker takes to import the service and to
+answer its first requests. Every run uses a new Python process so nothing
+is warmed up.
+
+Usage:
+    python -m benchmarks.startup [--runs 5] [--database-uri sqlite:///...]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Runs in a fresh interpreter and prints the timings as JSON
+WORKER = """
+import json, time
+start = time.perf_counter()
+from service import app
+imported = time.perf_counter()
+client = app.test_client()
+client.get("/health")
+health = time.perf_counter()
+client.get("/pets")
+pets = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "first /health": health - imported,
+    "first /pets": pets - health,
+}))
+"""
+
+
+def run_worker(env: dict) -> dict:
+    """Starts a fresh interpreter and returns its startup timings"""
+    result = subprocess.run(
+        [sys.executable, "-c", WORKER], env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    """Runs the startup benchmark and prints a report"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="number of fresh workers to time")
+    parser.add_argument("--database-uri", help="database to use (default: a temporary SQLite file)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = dict(os.environ)
+        env["DATABASE_URI"] = args.database_uri or f"sqlite:///{tmp_dir}/startup.db"
+        # the tables are created once up front just like a deployment would
+        subprocess.run(
+            [sys.executable, "-m", "flask", "--app", "service:app", "init-db"],
+            env=env, capture_output=True, check=True,
+        )
+        runs = [run_worker(env) for _ in range(args.runs)]
+
+    print(f"Startup over {args.runs} fresh workers (milliseconds)")
+    print(f"{'phase':<16}{'min':>10}{'median':>10}{'max':>10}")
+    for phase in runs[0]:
+        times = [run[phase] * 1000 for run in runs]
+        print(f"{phase:<16}{min(times):>10.1f}{statistics.median(times):>10.1f}{max(times):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Validation Benchmark
+
+Compares the original try/except Pet.deserialize with the compiled
+PET_SCHEMA validator, one payload at a time and as a batch.
+
+Usage:
+    python -m benchmarks.validation [--payloads 10000] [--invalid 0.1]
+"""
+import argparse
+import os
+import random
+import timeit
+from datetime import date
+
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+
+# pylint: disable=wrong-import-position
+from service.models import Pet, Gender, PET_SCHEMA, DataValidationError  # noqa: E402
+from tests.factories import PetFactory  # noqa: E402
+
+
+def legacy_deserialize(pet: Pet, data: dict) -> Pet:
+    """Pet.deserialize as it was before PET_SCHEMA, kept as the baseline"""
+    try:
+        pet.name = data["name"]
+        pet.category = data["category"]
+        if isinstance(data["available"], bool):
+            pet.available = data["available"]
+        else:
+            raise DataValidationError("Invalid type for boolean [available]: " + str(type(data["available"])))
+        pet.gender = getattr(Gender, data["gender"])
+        pet.birthday = date.fromisoformat(data["birthday"])
+    except AttributeError as error:
+        raise DataValidationError("Invalid attribute: " + error.args[0]) from error
+    except KeyError as error:
+        raise DataValidationError("Invalid pet: missing " + error.args[0]) from error
+    except TypeError as error:
+        raise DataValidationError("Invalid pet: body of request contained bad or no data " + str(error)) from error
+    return pet
+
+
+def one_at_a_time(deserialize, payloads: list) -> None:
+    """Deserializes the payloads one by one the way the bulk endpoint used to"""
+    for data in payloads:
+        try:
+            deserialize(Pet(), data)
+        except DataValidationError:
+            pass
+
+
+def make_payloads(count: int, invalid: float) -> list:
+    """Returns count Pet payloads with a fraction of them made invalid"""
+    payloads = [pet.serialize() for pet in PetFactory.build_batch(count)]
+    for data in random.sample(payloads, int(count * invalid)):
+        data["gender"] = data["gender"].lower()
+    return payloads
+
+
+def main():
+    """Runs the validation benchmark and prints a report"""
+    parser = argparse.ArgumentParser(description="Compare Pet payload validators")
+    parser.add_argument("--payloads", type=int, default=10_000)
+    parser.add_argument("--invalid", type=float, default=0.1, help="fraction of invalid payloads")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.payloads, args.invalid)
+    cases = [
+        ("legacy deserialize", lambda: one_at_a_time(legacy_deserialize, payloads)),
+        ("Pet.deserialize", lambda: one_at_a_time(Pet.deserialize, payloads)),
+        ("Pet.deserialize_many", lambda: Pet.deserialize_many(payloads)),
+        ("PET_SCHEMA.validate_many", lambda: PET_SCHEMA.validate_many(payloads)),
+    ]
+    print(f"{'validator':<26}{'payloads/sec':>14}")
+    for name, case in cases:
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        print(f"{name:<26}{args.payloads / best:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Async Pet Store Service
+
+Serves the /pets API as an ASGI application on an async SQLAlchemy engine,
+so a single process can have many requests waiting on the database at once
+instead of one slow query blocking the only worker. It shares the models,
+validation and configuration of the Flask service.
+
+Run it with:
+    gunicorn -k uvicorn.workers.UvicornWorker service.asgi:app
+
+Paths
+-----
+GET /health - Returns the health of the service
+GET /pets - Returns a page of Pets matching the filters in the query string,
+            name search, streaming and ?paginate=false are Flask only
+POST /pets - Creates a new Pet
+GET /pets/{id} - Returns the Pet with a given id
+PUT /pets/{id} - Updates a Pet
+DELETE /pets/{id} - Deletes a Pet
+PUT /pets/{id}/purchase - Purchases a Pet
+"""
+import contextlib
+import logging
+from http import HTTPStatus
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from werkzeug.exceptions import HTTPException as WerkzeugHTTPException
+from werkzeug.http import parse_etags, quote_etag
+from service import app as flask_app
+from service.models import Pet, DataValidationError, cache, select_fields, serialize_rows
+from service.pet_stats import PetStats
+from service.routes import decode_cursor, encode_cursor, fields_etag, get_fields, get_pet_filters, pet_etag
+from service.utils import status
+from service.utils.db_pool import engine_options
+
+logger = logging.getLogger("flask.app")
+
+# async driver to use for each database backend
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+######################################################################
+# D A T A B A S E
+######################################################################
+def async_database_uri(uri: str) -> str:
+    """Returns the database uri with the driver swapped for its async driver"""
+    url = make_url(uri)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(hide_password=False)
+
+
+def create_engine(config: dict):
+    """Creates the async engine from the configuration of the Flask service"""
+    uri = config["ASYNC_DATABASE_URI"] or async_database_uri(config["DATABASE_URI"])
+    options = engine_options(uri, config["SQLALCHEMY_ENGINE_OPTIONS"])
+    # TimedQueuePool only works with sync engines, so use the async version of QueuePool
+    if "poolclass" in options:
+        options["poolclass"] = AsyncAdaptedQueuePool
+    return create_async_engine(uri, **options)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(asgi_app: Starlette):
+    """Opens the async engine when the server starts and closes it when it stops"""
+    engine = create_engine(flask_app.config)
+    asgi_app.state.engine = engine
+    asgi_app.state.sessions = async_sessionmaker(engine, expire_on_commit=False)
+    logger.info("Async service initialized on %s", engine.url.get_backend_name())
+    yield
+    await engine.dispose()
+
+
+######################################################################
+# R O U T E S
+######################################################################
+async def health(request):  # pylint: disable=unused-argument
+    """Health Status"""
+    return JSONResponse({"status": "OK"})
+
+
+async def list_pets(request):
+    """Returns a page of the Pets that match every filter in the query string"""
+    check_list_options(request.query_params)
+    filters = get_pet_filters(request.query_params)
+    fields = get_fields(request.query_params)
+    limit, after_id = get_page(request)
+
+    statement = select(*select_fields(fields)).where(*Pet.filter_criteria(**filters))
+    async with request.app.state.sessions() as session:
+        # fetch one extra row to find out if there is a next page
+        result = await session.execute(Pet.page_query(statement, limit + 1, after_id))
+        pets = list(serialize_rows(result, fields))
+
+    headers = {}
+    if len(pets) > limit:
+        pets = pets[:limit]
+        next_url = request.url.include_query_params(limit=limit, cursor=encode_cursor(pets[-1]["id"]))
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    return JSONResponse(pets, headers=headers)
+
+
+async def get_pets(request):
+    """Retrieves a single Pet, or only the fields asked for with ?fields="""
+    pet_id = request.path_params["pet_id"]
+    fields = get_fields(request.query_params)
+    async with request.app.state.sessions() as session:
+        if fields:
+            statement = select(*select_fields(fields), Pet.version).where(Pet.id == pet_id)
+            row = (await session.execute(statement)).first()
+            if row is None:
+                raise StarletteHTTPException(status.HTTP_404_NOT_FOUND, f"Pet with id '{pet_id}' was not found.")
+            *values, version = row
+            data = next(serialize_rows([values], fields))
+            etag = fields_etag(pet_id, version, fields)
+        else:
+            pet = await find_or_404(session, pet_id)
+            data = pet.serialize()
+            etag = pet_etag(pet)
+
+    if parse_etags(request.headers.get("If-None-Match")).contains(etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": quote_etag(etag)})
+    return JSONResponse(data, headers={"ETag": quote_etag(etag)})
+
+
+async def create_pets(request):
+    """Creates a Pet from the posted JSON"""
+    pet = Pet().deserialize(await get_json(request))
+    async with request.app.state.sessions() as session:
+        session.add(pet)
+        await session.commit()
+    cache.invalidate(pet.id)
+    logger.info("Pet with ID [%s] created.", pet.id)
+
+    headers = {
+        "Location": str(request.url_for("get_pets", pet_id=pet.id)),
+        "ETag": quote_etag(pet_etag(pet)),
+    }
+    return JSONResponse(pet.serialize(), status_code=status.HTTP_201_CREATED, headers=headers)
+
+
+async def update_pets(request):
+    """Updates a Pet, rejecting the update with 412 if If-Match is out of date"""
+    pet_id = request.path_params["pet_id"]
+    data = await get_json(request)
+    async with request.app.state.sessions() as session:
+        pet = await find_or_404(session, pet_id)
+        check_if_match(request, pet)
+        pet.deserialize(data)
+        try:
+            await session.commit()
+        finally:
+            cache.invalidate(pet_id)
+
+    logger.info("Pet with ID [%s] updated.", pet_id)
+    return JSONResponse(pet.serialize(), headers={"ETag": quote_etag(pet_etag(pet))})
+
+
+async def delete_pets(request):
+    """Deletes a Pet"""
+    pet_id = request.path_params["pet_id"]
+    async with request.app.state.sessions() as session:
+        pet = await session.get(Pet, pet_id)
+        check_if_match(request, pet)
+        if pet:
+            await session.delete(pet)
+            try:
+                await session.commit()
+            finally:
+                cache.invalidate(pet_id)
+
+    logger.info("Pet with ID [%s] delete complete.", pet_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+async def purchase_pets(request):
+    """Purchases a Pet with the same single conditional UPDATE as the Flask service"""
+    pet_id = request.path_params["pet_id"]
+    async with request.app.state.sessions() as session:
+        row = (await session.execute(Pet.purchase_statement(pet_id))).first()
+        if row is not None:
+            connection = await session.connection()
+            await connection.run_sync(PetStats.apply, PetStats.purchase_deltas(row))
+        await session.commit()
+        cache.invalidate(pet_id)
+        if row is None:
+            # only a failed purchase needs to look up why it failed
+            await find_or_404(session, pet_id)
+            raise StarletteHTTPException(status.HTTP_409_CONFLICT, f"Pet with id '{pet_id}' is not available.")
+
+    pet = Pet(**row._asdict())
+    return JSONResponse(pet.serialize(), headers={"ETag": quote_etag(pet_etag(pet))})
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+async def find_or_404(session, pet_id: int) -> Pet:
+    """Returns the Pet with the given id or raises a 404"""
+    pet = await session.get(Pet, pet_id)
+    if pet is None:
+        raise StarletteHTTPException(status.HTTP_404_NOT_FOUND, f"Pet with id '{pet_id}' was not found.")
+    return pet
+
+
+async def get_json(request):
+    """Returns the JSON body of a request that must be application/json"""
+    content_type = request.headers.get("Content-Type")
+    if not content_type:
+        raise StarletteHTTPException(status.HTTP_400_BAD_REQUEST, "No Content-Type set")
+    if content_type != "application/json":
+        raise StarletteHTTPException(
+            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, "Content-Type must be application/json"
+        )
+    try:
+        return await request.json()
+    except ValueError as error:
+        raise StarletteHTTPException(status.HTTP_400_BAD_REQUEST, "Request body is not valid JSON") from error
+
+
+def check_list_options(params) -> None:
+    """Rejects the list options of the Flask service that this one does not support
+
+    Ignoring them would quietly return something other than what was asked for.
+    """
+    for name in ["name_prefix", "name_fuzzy"]:
+        if name in params:
+            raise StarletteHTTPException(status.HTTP_400_BAD_REQUEST, f"{name} is not supported")
+    if params.get("stream", "false").lower() in ["yes", "y", "true", "t", "1"]:
+        raise StarletteHTTPException(status.HTTP_400_BAD_REQUEST, "stream is not supported")
+    if params.get("paginate", "true").lower() in ["no", "n", "false", "f", "0"]:
+        raise StarletteHTTPException(status.HTTP_400_BAD_REQUEST, "paginate=false is not supported")
+
+
+def get_page(request) -> tuple:
+    """Returns the page size and the id to start after from the query string"""
+    limit = flask_app.config["PAGE_SIZE_DEFAULT"]
+    if "limit" in request.query_params:
+        try:
+            limit = int(request.query_params["limit"])
+        except ValueError:
+            limit = 0
+    if limit < 1:
+        raise StarletteHTTPException(status.HTTP_400_BAD_REQUEST, "limit must be a positive integer")
+    limit = min(limit, flask_app.config["PAGE_SIZE_MAX"])
+
+    cursor = request.query_params.get("cursor")
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def check_if_match(request, pet: Pet) -> None:
+    """Checks that the Pet is the version given in the If-Match header"""
+    if_match = request.headers.get("If-Match")
+    if not if_match:
+        return  # unconditional request
+    if pet and parse_etags(if_match).contains(pet_etag(pet)):
+        return  # version OK
+    raise StarletteHTTPException(
+        status.HTTP_412_PRECONDITION_FAILED, "The pet was changed, get it again and retry"
+    )
+
+
+######################################################################
+# E R R O R   H A N D L E R S
+######################################################################
+def error_response(code: int, error: str, message: str, **extra) -> JSONResponse:
+    """Returns an error in the same JSON form as the Flask error handlers"""
+    logger.warning(message)
+    return JSONResponse({"status": code, "error": error, "message": message, **extra}, status_code=code)
+
+
+async def http_error(request, error):  # pylint: disable=unused-argument
+    """Handles the HTTP errors raised by the routes and the shared helpers"""
+    if isinstance(error, WerkzeugHTTPException):
+        return error_response(error.code, error.name, error.description)
+    return error_response(error.status_code, HTTPStatus(error.status_code).phrase, error.detail)
+
+
+async def validation_error(request, error):  # pylint: disable=unused-argument
+    """Handles bad data and reports every invalid field"""
+    return error_response(status.HTTP_400_BAD_REQUEST, "Bad Request", str(error), fields=error.errors)
+
+
+async def stale_data_error(request, error):  # pylint: disable=unused-argument
+    """Handles update conflicts from the row version check"""
+    return error_response(status.HTTP_412_PRECONDITION_FAILED, "Precondition Failed", str(error))
+
+
+app = Starlette(
+    routes=[
+        Route("/health", health),
+        Route("/pets", list_pets, methods=["GET"]),
+        Route("/pets", create_pets, methods=["POST"]),
+        Route("/pets/{pet_id:int}", get_pets, methods=["GET"]),
+        Route("/pets/{pet_id:int}", update_pets, methods=["PUT"]),
+        Route("/pets/{pet_id:int}", delete_pets, methods=["DELETE"]),
+        Route("/pets/{pet_id:int}/purchase", purchase_pets, methods=["PUT"]),
+    ],
+    exception_handlers={
+        StarletteHTTPException: http_error,
+        WerkzeugHTTPException: http_error,
+        DataValidationError: validation_error,
+        StaleDataError: stale_data_error,
+    },
+    lifespan=lifespan,
+    middleware=[
+        Middleware(
+            GZipMiddleware,
+            minimum_size=flask_app.config["COMPRESS_MIN_SIZE"],
+            compresslevel=flask_app.config["COMPRESS_LEVEL"],
+        )
+    ] if flask_app.config["COMPRESS_RESPONSES"] else [],
+)
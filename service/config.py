@@ -20,8 +20,76 @@ if 'VCAP_SERVICES' in os.environ:
 # Configure SQLAlchemy
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
-# SQLALCHEMY_POOL_SIZE = 2
+
+# Connection pool for each worker. Size it so that
+#   replicas * workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) < max_connections
+# on the database server. GET /stats/pool shows how busy the pool is.
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ["yes", "y", "true", "t", "1"],
+}
+
+# Read replicas, as a comma separated list of uris, for the reads of GET
+# requests. A client that wrote reads from the primary for the next
+# REPLICA_STICKY_SECONDS so that it sees its own writes, and a replica that
+# cannot be reached is left out for REPLICA_EJECT_SECONDS.
+DATABASE_REPLICA_URIS = [uri.strip() for uri in os.getenv("DATABASE_REPLICA_URIS", "").split(",") if uri.strip()]
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+REPLICA_EJECT_SECONDS = float(os.getenv("REPLICA_EJECT_SECONDS", "30"))
+
+# Database for the async service in service.asgi. When it is not set the
+# DATABASE_URI is used with its async driver (asyncpg or aiosqlite).
+ASYNC_DATABASE_URI = os.getenv("ASYNC_DATABASE_URI")
+
+# Statements slower than this are written to the slow query log
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+
+# Keyset pagination for GET /pets
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+
+# Number of rows fetched per round trip when streaming GET /pets?stream=true
+STREAM_YIELD_PER = int(os.getenv("STREAM_YIELD_PER", "500"))
+
+# Number of rows written per multi-row INSERT by POST /pets/batch
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+
+# Read-through cache for Pet.find (a size of 0 disables it). Each worker has its
+# own, so a Pet changed by another worker can be served stale for up to the TTL
+PET_CACHE_SIZE = int(os.getenv("PET_CACHE_SIZE", "1024"))
+PET_CACHE_TTL = float(os.getenv("PET_CACHE_TTL", "30"))
+
+# Number of results of a name search (GET /pets?name_prefix= or ?name_fuzzy=)
+SEARCH_LIMIT_DEFAULT = int(os.getenv("SEARCH_LIMIT_DEFAULT", "10"))
+# Seconds before the in-process name index used on SQLite is rebuilt (0 for never)
+NAME_INDEX_TTL = float(os.getenv("NAME_INDEX_TTL", "300"))
+
+# Compress JSON responses of at least COMPRESS_MIN_SIZE bytes with brotli or
+# gzip, unless a proxy in front of the service already does
+COMPRESS_RESPONSES = os.getenv("COMPRESS_RESPONSES", "true").lower() in ["yes", "y", "true", "t", "1"]
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+COMPRESS_MIMETYPES = ["application/json"]
+
+# Commit the single Pet writes of concurrent requests together in one
+# transaction. A write waits up to WRITE_BATCH_WINDOW_MS for others to join
+# its batch, and a batch holds at most WRITE_BATCH_MAX_SIZE writes.
+WRITE_COALESCING = os.getenv("WRITE_COALESCING", "false").lower() in ["yes", "y", "true", "t", "1"]
+WRITE_BATCH_WINDOW_MS = float(os.getenv("WRITE_BATCH_WINDOW_MS", "2"))
+WRITE_BATCH_MAX_SIZE = int(os.getenv("WRITE_BATCH_MAX_SIZE", "64"))
+# Seconds a request waits for its batch to be committed before it fails with 503
+WRITE_TIMEOUT_SECONDS = float(os.getenv("WRITE_TIMEOUT_SECONDS", "10"))
+
+# Seconds that browsers may cache the fingerprinted static files
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "31536000"))
 
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "sup3r-s3cr3t")
 LOGGING_LEVEL = logging.INFO
+# Log records waiting for the background writer before new ones are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Fraction of requests whose info logs are kept (warnings are always kept)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
@@ -0,0 +1,210 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Gunicorn Configuration
+
+Sizes the workers from the CPUs and memory the container may actually
+use and the threads from the database connection pool, preloads the app
+and resets what must not be shared after each worker is forked.
+
+Usage:
+    gunicorn --config=service/gunicorn_conf.py service:app
+
+Load it by path rather than as python:service.gunicorn_conf, which would
+import the service package, and so create the app, before gunicorn has
+set up the log handlers that the app writes to.
+
+Every setting can be overridden with the environment variable named next
+to it or on the command line.
+"""
+# pylint: disable=invalid-name
+import math
+import os
+import tempfile
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+TRUTHY = ["yes", "y", "true", "t", "1"]
+
+# cgroup v1 reports no memory limit as a number close to 2**63
+UNLIMITED_MEMORY = 2**60
+
+
+def cgroup_cpu_limit(root: str = CGROUP_ROOT):
+    """Returns the CPU quota of the cgroup as a number of CPUs or None if there is none"""
+    try:
+        # cgroup v2 has "<quota> <period>" with a quota of "max" when unlimited
+        with open(os.path.join(root, "cpu.max"), encoding="utf-8") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1 has the quota and period in two files with -1 when unlimited
+        with open(os.path.join(root, "cpu", "cpu.cfs_quota_us"), encoding="utf-8") as quota_file:
+            quota = int(quota_file.read())
+        with open(os.path.join(root, "cpu", "cpu.cfs_period_us"), encoding="utf-8") as period_file:
+            period = int(period_file.read())
+    except (OSError, ValueError):
+        return None
+    if quota <= 0 or period <= 0:
+        return None
+    return quota / period
+
+
+def cgroup_memory_limit(root: str = CGROUP_ROOT):
+    """Returns the memory limit of the cgroup in bytes or None if there is none"""
+    for path in ["memory.max", os.path.join("memory", "memory.limit_in_bytes")]:
+        try:
+            with open(os.path.join(root, path), encoding="utf-8") as limit_file:
+                limit = limit_file.read().strip()
+        except OSError:
+            continue
+        if limit == "max":
+            return None
+        try:
+            limit = int(limit)
+        except ValueError:
+            return None
+        return limit if 0 < limit < UNLIMITED_MEMORY else None
+    return None
+
+
+def cpu_count(root: str = CGROUP_ROOT) -> int:
+    """Returns the number of CPUs this process may use
+
+    This is the smaller of the CPUs it is pinned to and its cgroup quota,
+    rounded up, so a container limited to 1.5 CPUs on a 64 CPU host counts 2.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit(root)
+    if limit is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(cpus, 1)
+
+
+def worker_count(worker_memory_mb: int, max_workers: int, root: str = CGROUP_ROOT) -> int:
+    """Returns the number of workers that the CPUs and memory of this process can carry
+
+    This is the usual (2 x CPUs) + 1, no more than max_workers, and no more
+    than fit in the memory limit next to the master process when each of
+    them takes about worker_memory_mb.
+    """
+    count = min(cpu_count(root) * 2 + 1, max_workers)
+    limit = cgroup_memory_limit(root)
+    if limit is not None:
+        count = min(count, limit // (worker_memory_mb * 1024 * 1024) - 1)
+    return max(count, 1)
+
+
+######################################################################
+# S E T T I N G S
+######################################################################
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8080')}")
+
+# The usual (2 x CPUs) + 1 workers, up to GUNICORN_MAX_WORKERS and as many
+# as fit in the memory limit at GUNICORN_WORKER_MEMORY_MB each, with a
+# thread per pooled connection so that requests do not queue up waiting for
+# the pool. Each worker has its own pool, so an instance opens up to
+#   workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+# database connections.
+workers = int(
+    os.getenv(
+        "WEB_CONCURRENCY",
+        str(
+            worker_count(
+                int(os.getenv("GUNICORN_WORKER_MEMORY_MB", "40")),
+                int(os.getenv("GUNICORN_MAX_WORKERS", "8")),
+            )
+        ),
+    )
+)
+threads = int(os.getenv("GUNICORN_THREADS", os.getenv("DB_POOL_SIZE", "5")))
+
+# Import the app once in the master so that workers start fast and share
+# its memory pages; post_fork() resets what must not be shared
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in TRUTHY
+
+# Keep connections from the load balancer open a little longer than it
+# waits between requests so it does not reuse a connection we just closed
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# Recycle workers to bound memory creep, with jitter so that they do not
+# all restart at the same time
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+# Heartbeat files on tmpfs so a slow container disk cannot stall workers
+worker_tmp_dir = os.getenv("GUNICORN_WORKER_TMP_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else None)
+
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+errorlog = "-"
+
+# Each worker writes its Prometheus samples to files in this directory so
+# that /metrics adds up all of the workers. prometheus_client only does so
+# if the variable is set when it is first imported, so it is passed with
+# raw_env, which gunicorn applies before it preloads the app. The files of
+# an earlier run are removed in on_starting().
+metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "pet-service-metrics"))
+os.makedirs(metrics_dir, exist_ok=True)
+raw_env = [f"PROMETHEUS_MULTIPROC_DIR={metrics_dir}"]
+
+
+######################################################################
+# S E R V E R   H O O K S
+######################################################################
+def on_starting(server):  # pylint: disable=unused-argument
+    """Removes the Prometheus samples left over from an earlier run"""
+    for name in os.listdir(metrics_dir):
+        if name.endswith(".db"):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Resets the connection pool and the log writer inherited from the master
+
+    Connections opened in the master must never be used by two workers,
+    so each worker starts with an empty pool. dispose(close=False) leaves
+    the parent's connections alone rather than closing them from the child.
+    """
+    if not server.cfg.preload_app:
+        return  # the app is imported after the fork
+
+    # pylint: disable=import-outside-toplevel
+    from service import app
+    from service.models import db, replicas
+    from service.utils import log_handlers
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    replicas.dispose(close=False)
+    log_handlers.restart_logging(app)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Removes the Prometheus live gauges of a worker that has exited"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess  # pylint: disable=import-outside-toplevel
+
+        multiprocess.mark_process_dead(worker.pid)
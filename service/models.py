@@ -15,7 +15,7 @@
 """
 Models for Pet Demo Service
 
-All of the models are stored in this module
+The Pet model and the database it is stored in are set up in this module
 
 Models
 ------
@@ -26,18 +26,73 @@ Attributes:
 name (string) - the name of the pet
 category (string) - the category the pet belongs to (i.e., dog, cat)
 available (boolean) - True for pets that are available for adoption
+version (integer) - row version that is incremented on every update
+
+PetStats, the number of Pets in each group, is in service.pet_stats
 
 """
+import itertools
 import logging
+import time
+from collections import Counter
 from enum import Enum
 from datetime import date
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import DDL, event
+from sqlalchemy.sql.expression import UpdateBase
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.exc import StaleDataError
+from service.utils.cache import LRUCache
+from service.utils.db_pool import engine_options
+from service.utils.name_index import NameIndex
+from service.utils.replicas import ReplicaRouter, read_from_replica, request_replica, wrote_recently
+from service.utils.schema import Schema, String, Boolean, Choice, Date, format_errors
+from service.utils.write_coalescer import WriteCoalescer
 
 logger = logging.getLogger("flask.app")
 
+# Read replicas for the reads of GET requests, configured in init_db()
+replicas = ReplicaRouter()
+
+
+class RoutingSession(FlaskSession):  # pylint: disable=too-few-public-methods
+    """A session that sends the reads of GET requests to a read replica
+
+    Flushes, INSERT, UPDATE and DELETE statements and everything outside
+    of a GET request go to the primary.
+    """
+
+    def get_bind(
+        self, mapper=None, clause=None, bind=None, _sa_skip_events=None, _sa_skip_for_implicit_returning=False, **kwargs
+    ):
+        """Returns the replica for a read of a GET request, otherwise the usual bind"""
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase):
+            replica = request_replica(replicas)
+            if replica is not None:
+                return replica
+        return super().get_bind(
+            mapper, clause=clause, bind=bind, _sa_skip_events=_sa_skip_events,
+            _sa_skip_for_implicit_returning=_sa_skip_for_implicit_returning, **kwargs
+        )
+
+
 # Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Read-through cache of serialized Pets keyed by id, configured in init_db()
+cache = LRUCache()
+
+# Name search for databases without trigram indexes, configured in init_db()
+name_index = NameIndex()
+
+# The most ids of name matches that are read in one query
+RANKED_BATCH_LIMIT = 500
+
+# Commits the single Pet writes of concurrent requests together when
+# WRITE_COALESCING is on, configured in init_db()
+writes = WriteCoalescer()
 
 
 def init_db(app):
@@ -45,9 +100,67 @@ def init_db(app):
     Pet.init_db(app)
 
 
+def commit_write(operation):
+    """Runs operation(session) and commits it, returning what it returned
+
+    When writes are coalesced the writer thread runs it in its own session,
+    together with the writes of other requests, otherwise it is run and
+    committed on the session of the request.
+    """
+    if writes.enabled:
+        return writes.submit(operation)
+    result = operation(db.session)
+    db.session.commit()
+    return result
+
+
+def create_tables():
+    """Creates any tables and indexes that are missing from the database
+
+    This is run once per deployment with 'flask init-db' rather than by
+    every worker when it starts.
+    """
+    logger.info("Creating database tables")
+    db.create_all()
+    create_indexes()
+
+
+def create_indexes():
+    """Creates any indexes that are missing from an existing database
+
+    db.create_all() only creates indexes along with new tables, so this is
+    how indexes added to the models are rolled out to existing databases.
+    On PostgreSQL they are built CONCURRENTLY so that the table can still be
+    written to meanwhile. A concurrent build that fails leaves an invalid
+    index behind, which has to be dropped before this is run again.
+    """
+    if db.engine.dialect.name != "postgresql":
+        for index in Pet.__table__.indexes:
+            logger.info("Creating index %s", index.name)
+            index.create(bind=db.engine, checkfirst=True)
+        return
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(TRIGRAM_EXTENSION)
+        for index in Pet.__table__.indexes:
+            logger.info("Creating index %s concurrently", index.name)
+            # only for this statement, db.create_all() builds them in a transaction
+            options = index.dialect_options["postgresql"]
+            options["concurrently"] = True
+            try:
+                index.create(bind=connection, checkfirst=True)
+            finally:
+                options["concurrently"] = False
+
+
 class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
+    def __init__(self, message: str, errors: dict = None):
+        super().__init__(message)
+        self.errors = errors or {}
+
 
 class Gender(Enum):
     """Enumeration of valid Pet Genders"""
@@ -57,7 +170,17 @@ class Gender(Enum):
     UNKNOWN = 3
 
 
-class Pet(db.Model):
+# Validator for Pet payloads, compiled once when the module is loaded
+PET_SCHEMA = Schema(
+    name=String(max_length=63),
+    category=String(max_length=63),
+    available=Boolean(),
+    gender=Choice(Gender),
+    birthday=Date(),
+)
+
+
+class Pet(db.Model):  # pylint: disable=too-many-public-methods
     """
     Class that represents a Pet
 
@@ -69,13 +192,40 @@ class Pet(db.Model):
     # Table Schema
     ##################################################
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(63), nullable=False)
+    name = db.Column(db.String(63), nullable=False, index=True)
     category = db.Column(db.String(63), nullable=False)
     available = db.Column(db.Boolean(), nullable=False, default=False)
     gender = db.Column(
         db.Enum(Gender), nullable=False, server_default=(Gender.UNKNOWN.name)
     )
     birthday = db.Column(db.Date(), nullable=False, default=date.today())
+    version = db.Column(db.Integer, nullable=False, server_default="1")
+
+    # let SQLAlchemy maintain the row version on every update
+    __mapper_args__ = {"version_id_col": version}
+
+    # category leads the composite index so it also serves category only queries.
+    # available and gender have too few values to be worth an index of their own.
+    # Name search on PostgreSQL uses an index on lower(name) that supports
+    # LIKE 'prefix%' and a trigram index for fuzzy matching; other databases
+    # use the in-process name_index instead. SQLite would otherwise hand the
+    # id of the last Pet to the next one once it is deleted, and ETags
+    # need ids that are never used again.
+    __table_args__ = (
+        db.Index("ix_pet_category_available_gender", category, available, gender),
+        db.Index(
+            "ix_pet_name_prefix",
+            db.func.lower(name).label("name_lower"),
+            postgresql_ops={"name_lower": "text_pattern_ops"},
+        ).ddl_if(dialect="postgresql"),
+        db.Index(
+            "ix_pet_name_trigram",
+            name,
+            postgresql_using="gist",
+            postgresql_ops={"name": "gist_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        {"sqlite_autoincrement": True},
+    )
 
     ##################################################
     # INSTANCE METHODS
@@ -91,23 +241,38 @@ class Pet(db.Model):
         logger.info("Creating %s", self.name)
         # id must be none to generate next primary key
         self.id = None  # pylint: disable=invalid-name
-        db.session.add(self)
-        db.session.commit()
+        self._commit(lambda session: session.add(self))
 
     def update(self):
         """
         Updates a Pet to the database
+
+        Raises StaleDataError if another update changed the version of
+        the Pet after it was read
         """
         logger.info("Saving %s", self.name)
         if not self.id:
             raise DataValidationError("Update called with empty ID field")
-        db.session.commit()
+        self._commit(lambda session: session.add(self))
 
     def delete(self):
         """Removes a Pet from the data store"""
         logger.info("Deleting %s", self.name)
-        db.session.delete(self)
-        db.session.commit()
+        self._commit(lambda session: session.delete(self))
+
+    def _commit(self, change):
+        """Commits a change to this Pet and drops it from the cache"""
+        if writes.enabled and self in db.session:
+            # the writer thread makes the change in a session of its own
+            db.session.expunge(self)
+        try:
+            commit_write(change)
+        except StaleDataError:
+            db.session.rollback()
+            logger.warning("Pet with id %s was changed by someone else", self.id)
+            raise
+        finally:
+            cache.invalidate(self.id)
 
     def serialize(self) -> dict:
         """Serializes a Pet into a dictionary"""
@@ -120,51 +285,159 @@ class Pet(db.Model):
             "birthday": self.birthday.isoformat()
         }
 
+    def stats_key(self) -> tuple:
+        """Returns the PetStats group that this Pet is counted in"""
+        available = False if self.available is None else self.available
+        return (self.category, self.gender or Gender.UNKNOWN, available)
+
     def deserialize(self, data: dict):
         """
         Deserializes a Pet from a dictionary
         Args:
             data (dict): A dictionary containing the Pet data
+
+        Raises DataValidationError listing every invalid field
         """
-        try:
-            self.name = data["name"]
-            self.category = data["category"]
-            if isinstance(data["available"], bool):
-                self.available = data["available"]
-            else:
-                raise DataValidationError(
-                    "Invalid type for boolean [available]: "
-                    + str(type(data["available"]))
-                )
-            self.gender = getattr(Gender, data["gender"])  # create enum from string
-            self.birthday = date.fromisoformat(data["birthday"])
-        except AttributeError as error:
-            raise DataValidationError("Invalid attribute: " + error.args[0]) from error
-        except KeyError as error:
-            raise DataValidationError("Invalid pet: missing " + error.args[0]) from error
-        except TypeError as error:
-            raise DataValidationError(
-                "Invalid pet: body of request contained bad or no data " + str(error)
-            ) from error
+        values, errors = PET_SCHEMA.validate(data)
+        if errors:
+            raise DataValidationError("Invalid pet: " + format_errors(errors), errors)
+        for name, value in values.items():
+            setattr(self, name, value)
         return self
 
     ##################################################
     # CLASS METHODS
     ##################################################
 
+    @classmethod
+    def deserialize_many(cls, items: list) -> tuple:
+        """
+        Deserializes a list of Pets in one pass
+
+        :param items: the dictionaries containing the Pet data
+        :type items: list
+
+        :return: the valid Pets and a list of (index, errors) for the invalid ones
+        :rtype: tuple
+        """
+        valid, invalid = PET_SCHEMA.validate_many(items)
+        pets = []
+        for values in valid:
+            pet = cls()
+            for name, value in values.items():
+                setattr(pet, name, value)
+            pets.append(pet)
+        return pets, invalid
+
+    @classmethod
+    def purchase(cls, pet_id: int):
+        """Purchases a Pet if it is available
+
+        This is a single conditional UPDATE ... RETURNING so the row lock is
+        only held for that one statement and concurrent buyers can never
+        purchase the same Pet twice.
+
+        :param pet_id: the id of the Pet to purchase
+        :type pet_id: int
+
+        :return: the purchased Pet, or None if it was not found or not available
+        :rtype: Pet
+
+        """
+        logger.info("Processing purchase for id %s ...", pet_id)
+
+        def buy(session):
+            row = session.execute(cls.purchase_statement(pet_id)).first()
+            if row is not None:
+                PetStats.apply(session.connection(), PetStats.purchase_deltas(row))
+            return row
+
+        row = commit_write(buy)
+        cache.invalidate(pet_id)
+        if row is None:
+            return None
+        return cls(**row._asdict())
+
+    @classmethod
+    def purchase_statement(cls, pet_id: int):
+        """Returns the UPDATE ... RETURNING statement that purchases a Pet"""
+        table = cls.__table__
+        return (
+            table.update()
+            .where(table.c.id == pet_id, table.c.available.is_(True))
+            .values(available=False, version=table.c.version + 1)
+            .returning(*table.columns)
+        )
+
+    @classmethod
+    def create_many(cls, pets: list, chunk_size: int = 1000) -> list:
+        """Creates Pets in bulk
+
+        Each chunk of Pets is written with a single multi-row INSERT and all
+        of the chunks are committed together in one transaction.
+
+        :param pets: the deserialized Pets to create
+        :type pets: list
+
+        :param chunk_size: the number of Pets written per INSERT
+        :type chunk_size: int
+
+        :return: the Pets that were created, with their new ids
+        :rtype: list
+
+        """
+        logger.info("Creating %d Pets in chunks of %d", len(pets), chunk_size)
+        table = cls.__table__
+        statement = table.insert().returning(*table.columns)
+        created = []
+        for start in range(0, len(pets), chunk_size):
+            rows = [
+                {
+                    "name": pet.name,
+                    "category": pet.category,
+                    "available": pet.available,
+                    "gender": pet.gender,
+                    "birthday": pet.birthday,
+                    "version": 1,
+                }
+                for pet in pets[start:start + chunk_size]
+            ]
+            result = db.session.execute(statement, rows)
+            created.extend(cls(**row._asdict()) for row in result.all())
+        PetStats.apply(db.session.connection(), Counter(pet.stats_key() for pet in created))
+        db.session.commit()
+        for pet in created:
+            name_index.update(pet.id, new_name=pet.name)
+        return created
+
     @classmethod
     def init_db(cls, app: Flask):
         """Initializes the database session
 
+        This only configures the engine, which connects lazily on first use,
+        so workers start without touching the database. Tables are created
+        separately with create_tables().
+
         :param app: the Flask app
         :type data: Flask
 
         """
         logger.info("Initializing database")
+        options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"], options)
+        replicas.configure(app.config["DATABASE_REPLICA_URIS"], options, app.config["REPLICA_EJECT_SECONDS"])
         # This is where we initialize SQLAlchemy from the Flask app
         db.init_app(app)
+        cache.configure(app.config["PET_CACHE_SIZE"], app.config["PET_CACHE_TTL"])
+        name_index.configure(app.config["NAME_INDEX_TTL"])
         app.app_context().push()
-        db.create_all()  # make our sqlalchemy tables
+        writes.configure(
+            app.config["WRITE_COALESCING"],
+            db.engine,
+            app.config["WRITE_BATCH_WINDOW_MS"] / 1000,
+            app.config["WRITE_BATCH_MAX_SIZE"],
+            app.config["WRITE_TIMEOUT_SECONDS"],
+        )
 
     @classmethod
     def all(cls) -> list:
@@ -176,6 +449,14 @@ class Pet(db.Model):
     def find(cls, pet_id: int):
         """Finds a Pet by it's ID
 
+        Pets are read through the cache. A cached Pet is attached to the
+        session without going to the database so it can still be updated
+        or deleted. Pets read from a replica, which may be behind, are not
+        cached, and a client that just wrote skips the cache so that it
+        reads its own writes from the primary. A Pet that was changed while
+        it was being read is not cached either, since the read may have
+        returned the version from before the change.
+
         :param pet_id: the id of the Pet to find
         :type pet_id: int
 
@@ -184,7 +465,19 @@ class Pet(db.Model):
 
         """
         logger.info("Processing lookup for id %s ...", pet_id)
-        return cls.query.get(pet_id)
+        data = None if wrote_recently() else cache.get(pet_id)
+        if data is not None:
+            pet = cls().deserialize(data)
+            pet.id = data["id"]
+            pet.version = data["version"]
+            make_transient_to_detached(pet)
+            return db.session.merge(pet, load=False)
+
+        read_at = time.monotonic()
+        pet = db.session.get(cls, pet_id)
+        if pet and not read_from_replica():
+            cache.set(pet_id, dict(pet.serialize(), version=pet.version), read_at=read_at)
+        return pet
 
     @classmethod
     def find_or_404(cls, pet_id: int):
@@ -198,7 +491,268 @@ class Pet(db.Model):
 
         """
         logger.info("Processing lookup or 404 for id %s ...", pet_id)
-        return cls.query.get_or_404(pet_id)
+        return db.get_or_404(cls, pet_id)
+
+    @classmethod
+    def find_by_filters(
+        cls,
+        category: str = None,
+        name: str = None,
+        available: bool = None,
+        gender: Gender = None,
+    ):
+        """Returns all Pets that match every one of the supplied filters
+
+        Filters that are None are ignored so calling this with no
+        filters matches all of the Pets.
+
+        :param category: the category of the Pets you want to match
+        :type category: str
+
+        :param name: the name of the Pets you want to match
+        :type name: str
+
+        :param available: True for pets that are available
+        :type available: bool
+
+        :param gender: values are ['MALE', 'FEMALE', 'UNKNOWN']
+        :type gender: enum
+
+        :return: a query for the Pets that match all of the filters
+        :rtype: Query
+
+        """
+        logger.info(
+            "Processing filter query for category=%s name=%s available=%s gender=%s ...",
+            category, name, available, gender,
+        )
+        return cls.query.filter(*cls.filter_criteria(category, name, available, gender))
+
+    @classmethod
+    def filter_criteria(
+        cls,
+        category: str = None,
+        name: str = None,
+        available: bool = None,
+        gender: Gender = None,
+    ) -> list:
+        """Returns the WHERE criteria for the filters of find_by_filters() that are not None"""
+        criteria = []
+        if category is not None:
+            criteria.append(cls.category == category)
+        if name is not None:
+            criteria.append(cls.name == name)
+        if available is not None:
+            criteria.append(cls.available == available)
+        if gender is not None:
+            criteria.append(cls.gender == gender)
+        return criteria
+
+    @classmethod
+    def search_by_name(cls, text: str, fuzzy: bool = False, limit: int = 10, fields: list = None, **filters) -> list:
+        """Returns the best matches for a name, for type-ahead
+
+        PostgreSQL answers from its prefix and trigram indexes. Other
+        databases look the names up in the in-process name_index and then
+        read only those Pets, so neither scans every Pet.
+
+        :param text: the start of the name, or for fuzzy the name to resemble
+        :type text: str
+
+        :param fuzzy: True to match names by trigram similarity
+        :type fuzzy: bool
+
+        :param limit: the maximum number of Pets to return
+        :type limit: int
+
+        :param fields: the serialized fields to return, which must include
+            id, or None for all of them
+        :type fields: list
+
+        :param filters: any of the filters of find_by_filters()
+
+        :return: the serialized Pets, ordered by name for a prefix or by
+            similarity, best first, for fuzzy
+        :rtype: list
+
+        """
+        logger.info("Processing %s name search for %s ...", "fuzzy" if fuzzy else "prefix", text)
+        query = cls.find_by_filters(**filters)
+        if db.engine.dialect.name != "postgresql":
+            return cls._read_ranked(query, cls._match_name_index(text, fuzzy), limit, fields)
+
+        if fuzzy:
+            query = query.filter(cls.name.op("%")(text)).order_by(cls.name.op("<->")(text), cls.id)
+        else:
+            name = db.func.lower(cls.name)
+            query = query.filter(name.startswith(text.lower(), autoescape=True)).order_by(name, cls.id)
+        return list(cls.serialize_query(query.limit(limit), fields=fields))
+
+    @classmethod
+    def _match_name_index(cls, text: str, fuzzy: bool):
+        """Returns the ids of the Pets whose names match, best first, from the in-process name_index"""
+
+        def load_names():
+            logger.info("Building the name index")
+            return db.session.execute(db.select(cls.id, cls.name)).all()
+
+        name_index.refresh(load_names)
+        return name_index.fuzzy(text) if fuzzy else name_index.prefix(text)
+
+    @classmethod
+    def _read_ranked(cls, query, ids, limit: int, fields: list) -> list:
+        """Returns up to limit of the Pets of a query that are among ids, in the order of ids"""
+        # read the candidates in rank order, in growing batches in case the
+        # filters reject many of them, but never more than fit in one IN list
+        results = []
+        batch_size = min(limit, RANKED_BATCH_LIMIT)
+        while len(results) < limit:
+            batch = list(itertools.islice(ids, batch_size))
+            if not batch:
+                break
+            candidates = query.filter(cls.id.in_(batch))
+            found = {pet["id"]: pet for pet in cls.serialize_query(candidates, fields=fields)}
+            results.extend(found[pet_id] for pet_id in batch if pet_id in found)
+            batch_size = min(batch_size * 2, RANKED_BATCH_LIMIT)
+        return results[:limit]
+
+    @classmethod
+    def summarize(cls, query) -> tuple:
+        """Returns a cheap aggregate that changes whenever the Pets in a query change
+
+        The count and the sum and max of the ids change when Pets are added
+        or removed and the sum of the row versions changes on every update,
+        so this can stand in for the rows without reading all of them. Those
+        sums can still cancel out across several changes, so the PetStats
+        change counter, which never repeats, is added too. The query is
+        aggregated as a subquery, so a page of a query with a LIMIT only
+        costs as much as reading that page.
+
+        :param query: the query to summarize
+        :type query: Query
+
+        :return: a tuple of (count, max id, sum of ids, sum of versions, changes)
+        :rtype: tuple
+
+        """
+        logger.info("Processing summary query ...")
+        rows = query.with_entities(cls.id, cls.version).subquery()
+        return tuple(
+            db.session.execute(
+                db.select(
+                    db.func.count(rows.c.id),
+                    db.func.max(rows.c.id),
+                    db.func.sum(rows.c.id),
+                    db.func.sum(rows.c.version),
+                    PetStats.change_counter(),
+                )
+            ).one()
+        )
+
+    @classmethod
+    def paginate(cls, query, limit: int, after_id: int = None) -> list:
+        """Returns a page of Pets using keyset pagination on the id
+
+        :param query: the query to take the page from
+        :type query: Query
+
+        :param limit: the maximum number of Pets to return
+        :type limit: int
+
+        :param after_id: only Pets with an id greater than this are returned
+        :type after_id: int
+
+        :return: a collection of at most limit Pets ordered by id
+        :rtype: list
+
+        """
+        logger.info("Processing page of %d after id %s ...", limit, after_id)
+        return cls.page_query(query, limit, after_id).all()
+
+    @classmethod
+    def page_query(cls, query, limit: int, after_id: int = None):
+        """Returns a query for a page of Pets using keyset pagination on the id
+
+        :param query: the query to take the page from
+        :type query: Query
+
+        :param limit: the maximum number of Pets to return
+        :type limit: int
+
+        :param after_id: only Pets with an id greater than this are returned
+        :type after_id: int
+
+        :return: a query for at most limit Pets ordered by id
+        :rtype: Query
+
+        """
+        if after_id is not None:
+            query = query.filter(cls.id > after_id)
+        return query.order_by(cls.id).limit(limit)
+
+    @classmethod
+    def serialize_query(cls, query, yield_per: int = None, fields: list = None):
+        """Serializes the Pets in a query without loading them into the ORM
+
+        The columns are selected as plain rows through SQLAlchemy Core and
+        turned into the same dictionaries as serialize() using the
+        precomputed ROW_FIELDS mapping, so no Pet instances, identity map
+        entries or Gender enums are created along the way. Only the columns
+        of the requested fields are selected.
+
+        :param query: the query for the Pets to serialize
+        :type query: Query
+
+        :param yield_per: fetch the rows in batches of this size from a
+            server-side cursor instead of all at once
+        :type yield_per: int
+
+        :param fields: the serialized fields to select, or None for all of them
+        :type fields: list
+
+        :return: a generator of serialized Pets
+        :rtype: generator
+
+        """
+        statement = cls.serialize_statement(query, fields)
+        if yield_per:
+            statement = statement.execution_options(yield_per=yield_per)
+        yield from serialize_rows(db.session.connection().execute(statement), fields)
+
+    @classmethod
+    def serialize_statement(cls, query, fields: list = None):
+        """Returns a SELECT of only the serialized columns of the Pets in a query"""
+        return query.with_entities(*select_fields(fields)).statement
+
+    @classmethod
+    def find_fields(cls, pet_id: int, fields: list):
+        """Finds some of the serialized fields of a Pet by it's ID
+
+        A cached Pet is trimmed to the fields, otherwise only their columns
+        and the row version are read from the database.
+
+        :param pet_id: the id of the Pet to find
+        :type pet_id: int
+
+        :param fields: the serialized fields to return
+        :type fields: list
+
+        :return: a tuple of the serialized fields and the version of the
+            Pet, or None if not found
+        :rtype: tuple
+
+        """
+        logger.info("Processing lookup of %s for id %s ...", fields, pet_id)
+        data = None if wrote_recently() else cache.get(pet_id)
+        if data is not None:
+            return {key: data[key] for key in fields}, data["version"]
+
+        statement = cls.serialize_statement(cls.query.filter(cls.id == pet_id), fields)
+        row = db.session.execute(statement.add_columns(cls.version)).first()
+        if row is None:
+            return None
+        *values, version = row
+        return next(serialize_rows([values], fields)), version
 
     @classmethod
     def find_by_name(cls, name: str) -> list:
@@ -255,3 +809,43 @@ class Pet(db.Model):
         """
         logger.info("Processing gender query for %s ...", gender.name)
         return cls.query.filter(cls.gender == gender)
+
+
+# The serialized key of each column for the fast read path in
+# Pet.serialize_query() with the function, if any, that converts its value.
+# Gender is read as the plain string stored in the database rather than
+# being turned into an enum and back into a string.
+ROW_FIELDS = {
+    "id": (Pet.id, None),
+    "name": (Pet.name, None),
+    "category": (Pet.category, None),
+    "available": (Pet.available, None),
+    "gender": (db.type_coerce(Pet.gender, db.String).label("gender"), None),
+    "birthday": (Pet.birthday, date.isoformat),
+}
+
+
+def select_fields(fields: list = None) -> list:
+    """Returns the columns to select for the serialized fields, all of them by default"""
+    return [ROW_FIELDS[key][0] for key in fields or ROW_FIELDS]
+
+
+def serialize_rows(rows, fields: list = None):
+    """Turns rows selected by Pet.serialize_statement() into serialized Pets"""
+    keys = list(fields or ROW_FIELDS)
+    conversions = [(key, ROW_FIELDS[key][1]) for key in keys if ROW_FIELDS[key][1]]
+    for row in rows:
+        data = dict(zip(keys, row))
+        for key, convert in conversions:
+            data[key] = convert(data[key])
+        yield data
+
+
+# pg_trgm provides the trigram operators for fuzzy name search on PostgreSQL
+TRIGRAM_EXTENSION = DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+event.listen(Pet.__table__, "before_create", TRIGRAM_EXTENSION.execute_if(dialect="postgresql"))
+
+# PetStats and the listeners that keep it up to date need Pet, so they are
+# imported once Pet is defined and Pet looks PetStats up when it is called
+# pylint: disable=wrong-import-position, cyclic-import
+from service.pet_stats import PetStats  # noqa: E402
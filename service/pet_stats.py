@@ -0,0 +1,222 @@
+######################################################################
+# Copyright 2016, 2022 John Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Pet Statistics
+
+Models
+------
+PetStats - The number of Pets in each category, gender and availability
+
+It also holds the session listeners that keep PetStats and the name_index
+up to date with the changes made to Pets through the ORM.
+"""
+import itertools
+import logging
+from collections import Counter
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from service.models import db, name_index, Pet, Gender
+
+logger = logging.getLogger("flask.app")
+
+# The INSERT ... ON CONFLICT construct of each database that PetStats supports
+UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+class PetStats(db.Model):
+    """
+    Class that represents the number of Pets in a group
+
+    There is one row for each combination of category, gender and
+    availability. The rows are kept up to date in the same transaction as
+    every change to the Pets, so reading the statistics costs one row per
+    group instead of a scan of every Pet.
+    """
+
+    __tablename__ = "pet_stats"
+
+    category = db.Column(db.String(63), primary_key=True)
+    gender = db.Column(db.Enum(Gender), primary_key=True)
+    available = db.Column(db.Boolean(), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    # only ever goes up, so unlike the count it can tell any two states apart
+    changes = db.Column(db.Integer, nullable=False, default=0)
+
+    def serialize(self) -> dict:
+        """Serializes the count of a group into a dictionary"""
+        return {
+            "category": self.category,
+            "gender": self.gender.name,
+            "available": self.available,
+            "count": self.count,
+        }
+
+    @classmethod
+    def all(cls) -> list:
+        """Returns the counts of all of the groups that have Pets"""
+        logger.info("Processing all PetStats")
+        return cls.query.filter(cls.count > 0).order_by(cls.category, cls.gender, cls.available).all()
+
+    @classmethod
+    def change_counter(cls):
+        """Returns a scalar subquery of the number of changes ever made to the Pets"""
+        return db.select(db.func.coalesce(db.func.sum(cls.changes), 0)).scalar_subquery()
+
+    @classmethod
+    def apply(cls, connection, deltas: Counter, changes: Counter = None) -> None:
+        """
+        Adds the changes in the number of Pets to their groups
+
+        This is an upsert so a group is created the first time a Pet is
+        counted in it. The groups are written in a fixed order so that
+        concurrent transactions lock them in the same order and cannot
+        deadlock each other.
+
+        :param connection: the connection of the transaction changing the Pets
+        :type connection: Connection
+
+        :param deltas: the change in the number of Pets by stats_key()
+        :type deltas: Counter
+
+        :param changes: the number of Pets created, changed or deleted by
+            stats_key(), which defaults to the size of each delta
+        :type changes: Counter
+
+        """
+        if changes is None:
+            changes = Counter({key: abs(delta) for key, delta in deltas.items()})
+        keys = sorted(deltas.keys() | changes.keys(), key=lambda key: (key[0], key[1].value, key[2]))
+        rows = [
+            {"category": key[0], "gender": key[1], "available": key[2], "count": deltas[key], "changes": changes[key]}
+            for key in keys
+            if deltas[key] or changes[key]
+        ]
+        if not rows:
+            return
+        table = cls.__table__
+        insert = UPSERTS[connection.dialect.name](table)
+        statement = insert.on_conflict_do_update(
+            index_elements=list(table.primary_key.columns),
+            set_={
+                "count": table.c.count + insert.excluded["count"],
+                "changes": table.c.changes + insert.excluded["changes"],
+            },
+        )
+        connection.execute(statement, rows)
+
+    @classmethod
+    def purchase_deltas(cls, row) -> Counter:
+        """Returns the change in the groups from the row of a purchased Pet"""
+        return Counter({(row.category, row.gender, True): -1, (row.category, row.gender, False): 1})
+
+    @classmethod
+    def rebuild(cls) -> None:
+        """Recounts every group from the Pets, for use after changes that bypassed the models"""
+        logger.info("Rebuilding PetStats")
+        counts = db.select(Pet.category, Pet.gender, Pet.available, db.func.count(Pet.id)).group_by(
+            Pet.category, Pet.gender, Pet.available
+        )
+        deltas = Counter({tuple(row[:3]): row[3] for row in db.session.execute(counts).all()})
+        # the counts are reset rather than deleted so the changes keep going up
+        db.session.execute(cls.__table__.update().values(count=0))
+        cls.apply(db.session.connection(), deltas)
+        db.session.commit()
+
+
+######################################################################
+# Keep PetStats up to date with the changes made through the ORM
+######################################################################
+@event.listens_for(Session, "before_flush")
+def count_pet_changes(session, flush_context, instances):  # pylint: disable=unused-argument
+    """Adds the Pets being created, changed and deleted to PetStats
+
+    This runs on the connection of the flush, so the counts are committed
+    or rolled back together with the Pets. Changes made with Core
+    statements (Pet.purchase and Pet.create_many) apply their own deltas.
+    """
+    deltas = Counter()
+    changes = Counter()
+    for pet in session.new:
+        if isinstance(pet, Pet):
+            deltas[pet.stats_key()] += 1
+            changes[pet.stats_key()] += 1
+    for pet in session.dirty:
+        if isinstance(pet, Pet) and session.is_modified(pet):
+            deltas[old_stats_key(session, pet)] -= 1
+            deltas[pet.stats_key()] += 1
+            changes[pet.stats_key()] += 1
+    for pet in session.deleted:
+        if isinstance(pet, Pet):
+            key = old_stats_key(session, pet)
+            deltas[key] -= 1
+            changes[key] += 1
+    PetStats.apply(session.connection(), deltas, changes)
+
+
+######################################################################
+# Keep the name_index up to date with the changes made through the ORM
+######################################################################
+@event.listens_for(Session, "after_flush")
+def record_name_changes(session, flush_context):  # pylint: disable=unused-argument
+    """Remembers the names that were flushed until the transaction ends"""
+    if name_index.built_at is None:
+        return  # the name_index is not in use
+    changes = session.info.setdefault("name_changes", [])
+    for pet in session.new:
+        if isinstance(pet, Pet):
+            changes.append((pet.id, None, pet.name))
+    for pet in itertools.chain(session.dirty, session.deleted):
+        if not isinstance(pet, Pet):
+            continue
+        deleted = pet in session.deleted
+        history = inspect(pet).attrs.name.history
+        if not deleted and not history.has_changes():
+            continue
+        old = history.deleted or history.unchanged
+        if not old:
+            name_index.clear()  # the old name was never loaded so start over
+            continue
+        changes.append((pet.id, old[0], None if deleted else pet.name))
+
+
+@event.listens_for(Session, "after_commit")
+def apply_name_changes(session):
+    """Applies the names of a committed transaction to the name_index"""
+    for pet_id, old_name, new_name in session.info.pop("name_changes", []):
+        name_index.update(pet_id, old_name, new_name)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_name_changes(session):
+    """Forgets the names of a transaction that was rolled back"""
+    session.info.pop("name_changes", None)
+
+
+def old_stats_key(session, pet: Pet) -> tuple:
+    """Returns the PetStats group a Pet was counted in before it was changed"""
+    state = inspect(pet)
+    values = []
+    for name in ("category", "gender", "available"):
+        history = state.attrs[name].history
+        old = history.deleted or history.unchanged
+        if not old:
+            # the old value was never loaded, so read it from the database
+            columns = (Pet.category, Pet.gender, Pet.available)
+            return tuple(session.connection().execute(db.select(*columns).where(Pet.id == pet.id)).one())
+        values.append(old[0])
+    return tuple(values)
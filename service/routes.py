@@ -18,16 +18,28 @@ Pet Store Service
 
 Paths:
 ------
-GET /pets - Returns a list all of the Pets
+GET /pets - Returns a page of the Pets (use ?limit= and ?cursor= to page)
 GET /pets/{id} - Returns the Pet with a given id number
 POST /pets - creates a new Pet record in the database
+POST /pets/batch - creates many Pet records from a JSON array or NDJSON
 PUT /pets/{id} - updates a Pet record in the database
 DELETE /pets/{id} - deletes a Pet record in the database
 """
 
-from flask import request, url_for, abort
-from service.models import Pet, Gender
+import base64
+import binascii
+import hashlib
+import json
+from flask import request, url_for, abort, Response, stream_with_context
+from werkzeug.http import quote_etag
+from service.models import Pet, Gender, ROW_FIELDS, db, cache, replicas
+from service.pet_stats import PetStats
 from service.utils import status  # HTTP Status Codes
+from service.utils.db_pool import pool_stats
+from service.utils.schema import format_errors
+from service.utils.compression import choose_encoding
+from service.utils.static_assets import StaticAssets
+from service.utils import metrics, log_handlers
 from . import app  # Import Flask application
 
 
@@ -40,6 +52,49 @@ def health():
     return {"status": 'OK'}, status.HTTP_200_OK
 
 
+############################################################
+# Prometheus Metrics Endpoint
+############################################################
+@app.route("/metrics")
+def prometheus_metrics():
+    """Returns the request metrics in the Prometheus text format"""
+    body, headers = metrics.export()
+    return body, status.HTTP_200_OK, headers
+
+
+############################################################
+# Cache Statistics Endpoint
+############################################################
+@app.route("/stats/cache")
+def cache_stats():
+    """Returns the hit and miss counters of the Pet cache"""
+    return cache.stats(), status.HTTP_200_OK
+
+
+############################################################
+# Logging Statistics Endpoint
+############################################################
+@app.route("/stats/logging")
+def logging_stats():
+    """Returns the size of the log queue and how many records were dropped"""
+    return log_handlers.stats(app), status.HTTP_200_OK
+
+
+############################################################
+# Connection Pool Statistics Endpoint
+############################################################
+@app.route("/stats/pool")
+def connection_pool_stats():
+    """Returns the connection counts and wait times of the database pool"""
+    return pool_stats(db.engine.pool), status.HTTP_200_OK
+
+
+@app.route("/stats/replicas")
+def replica_stats():
+    """Returns the health, number of reads and pool of each read replica"""
+    return {"replicas": replicas.stats()}, status.HTTP_200_OK
+
+
 ######################################################################
 # GET INDEX
 ######################################################################
@@ -47,7 +102,24 @@ def health():
 def index():
     """Root URL response"""
     app.logger.info("Request for Root URL")
-    return app.send_static_file("index.html")
+    return send_asset("index.html")
+
+
+######################################################################
+# STATIC FILES
+######################################################################
+# The static files are fingerprinted and compressed once when the service
+# starts and then served from memory in place of Flask's static view
+static_assets = StaticAssets(app.static_folder)
+static_assets.load()
+
+
+def serve_static(filename):
+    """Returns a static file"""
+    return send_asset(filename)
+
+
+app.view_functions["static"] = serve_static
 
 
 ######################################################################
@@ -55,34 +127,85 @@ def index():
 ######################################################################
 @app.route("/pets", methods=["GET"])
 def list_pets():
-    """Returns all of the Pets"""
+    """
+    Returns all of the Pets
+
+    Results are paged using keyset pagination on the Pet id. Use ?limit= to
+    set the page size and pass the cursor from the rel="next" Link header
+    as ?cursor= to get the next page. Use ?paginate=false to get every
+    matching Pet in a single response, or ?stream=true to have every
+    matching Pet streamed back without holding them all in memory.
+
+    Use ?fields=id,name to get only some of the fields of each Pet; only
+    their columns are selected from the database. The id is always included.
+
+    Use ?name_prefix= for type-ahead search on the start of the name, or
+    ?name_fuzzy= to find names that resemble it. Search returns the best
+    ?limit= matches, ranked by name or by similarity, in a single page.
+
+    The ETag is computed from an aggregate of the rows of the page and the
+    number of changes made to any Pet, so an If-None-Match request is
+    answered with 304 without serializing them.
+    Streamed responses have no ETag since that would mean reading every
+    matching row twice.
+    """
     app.logger.info("Request for pet list")
-    pets = []
-
-    category = request.args.get("category")
-    name = request.args.get("name")
-    available = request.args.get("available")
-    gender_name = request.args.get("gender")
-
-    if category:
-        app.logger.info("Filtering by category: %s", category)
-        pets = Pet.find_by_category(category)
-    elif name:
-        app.logger.info("Filtering by name:%s", name)
-        pets = Pet.find_by_name(name)
-    elif available:
-        app.logger.info("Filtering by available: %s", available)
-        is_available = available.lower() in ["yes", "y", "true", "t", "1"]
-        pets = Pet.find_by_availability(is_available)
-    elif gender_name:
-        app.logger.info("Filtering by gender: %s", gender_name)
-        gender = getattr(Gender, gender_name)  # create enum from string
-        pets = Pet.find_by_gender(gender)
+    filters = get_pet_filters(request.args)
+    app.logger.info("Filtering by: %s", filters)
+    fields = get_fields(request.args)
+    if "name_prefix" in request.args or "name_fuzzy" in request.args:
+        return search_pets(filters, fields)
+    pets = Pet.find_by_filters(**filters)
+
+    if request.args.get("stream", "false").lower() in ["yes", "y", "true", "t", "1"]:
+        app.logger.info("Streaming pets")
+        return stream_pets(pets, fields)
+
+    paginate = request.args.get("paginate", "true").lower() not in ["no", "n", "false", "f", "0"]
+    if paginate:
+        limit = get_limit(app.config["PAGE_SIZE_DEFAULT"])
+        cursor = request.args.get("cursor")
+        after_id = decode_cursor(cursor) if cursor else None
+        # fetch one extra row to find out if there is a next page
+        pets = Pet.page_query(pets, limit + 1, after_id)
+
+    etag = pets_etag(pets)
+    if request.if_none_match.contains_weak(etag):
+        app.logger.info("Pet list not modified")
+        return "", status.HTTP_304_NOT_MODIFIED, {"ETag": quote_etag(etag)}
+
+    headers = {"ETag": quote_etag(etag)}
+    if paginate:
+        results, link_headers = paginate_pets(pets, limit, fields)
+        headers.update(link_headers)
     else:
-        pets = Pet.all()
+        app.logger.info("Pagination disabled by request")
+        results = list(Pet.serialize_query(pets.order_by(Pet.id), fields=fields))
 
-    results = [pet.serialize() for pet in pets]
     app.logger.info("Returning %d pets", len(results))
+    return results, status.HTTP_200_OK, headers
+
+
+######################################################################
+# PET STATISTICS
+######################################################################
+@app.route("/pets/stats", methods=["GET"])
+def get_pet_stats():
+    """
+    Returns the number of Pets by category, gender and availability
+
+    The counts come from the PetStats summary table, so this reads one row
+    per group no matter how many Pets there are.
+    """
+    app.logger.info("Request for pet statistics")
+    groups = [stats.serialize() for stats in PetStats.all()]
+    results = {
+        "total": sum(group["count"] for group in groups),
+        "by_category": count_by(groups, "category"),
+        "by_gender": count_by(groups, "gender"),
+        "by_available": count_by(groups, "available"),
+        "groups": groups,
+    }
     return results, status.HTTP_200_OK
 
 
@@ -94,15 +217,25 @@ def get_pets(pet_id):
     """
     Retrieve a single Pet
 
-    This endpoint will return a Pet based on it's id
+    This endpoint will return a Pet based on it's id. Use ?fields=id,name
+    to get only some of its fields.
     """
     app.logger.info("Request for pet with id: %s", pet_id)
+    fields = get_fields(request.args)
+    if fields:
+        return get_pet_fields(pet_id, fields)
+
     pet = Pet.find(pet_id)
     if not pet:
         abort(status.HTTP_404_NOT_FOUND, f"Pet with id '{pet_id}' was not found.")
 
+    etag = pet_etag(pet)
+    if request.if_none_match.contains_weak(etag):
+        app.logger.info("Pet with ID [%s] not modified", pet.id)
+        return "", status.HTTP_304_NOT_MODIFIED, {"ETag": quote_etag(etag)}
+
     app.logger.info("Returning pet: %s", pet.name)
-    return pet.serialize(), status.HTTP_200_OK
+    return pet.serialize(), status.HTTP_200_OK, {"ETag": quote_etag(etag)}
 
 
 ######################################################################
@@ -126,8 +259,7 @@ def create_pets():
     # Check for form submission data
     if content_type == "application/x-www-form-urlencoded":
         app.logger.info("Processing FORM data")
-        app.logger.info(type(request.form))
-        app.logger.info(request.form)
+        app.logger.debug("Form data: %s", request.form)
         data = {
             "name": request.form["name"],
             "category": request.form["category"],
@@ -153,7 +285,40 @@ def create_pets():
     location_url = url_for("get_pets", pet_id=pet.id, _external=True)
 
     app.logger.info("Pet with ID [%s] created.", pet.id)
-    return pet.serialize(), status.HTTP_201_CREATED, {"Location": location_url}
+    headers = {"Location": location_url, "ETag": quote_etag(pet_etag(pet))}
+    return pet.serialize(), status.HTTP_201_CREATED, headers
+
+
+######################################################################
+# CREATE PETS IN BULK
+######################################################################
+@app.route("/pets/batch", methods=["POST"])
+def create_pets_in_bulk():
+    """
+    Creates many Pets
+
+    This endpoint takes a JSON array of Pets or newline delimited JSON
+    (application/x-ndjson) with one Pet per line. Every Pet is validated
+    and the valid ones are inserted a chunk at a time. The errors for the
+    Pets that could not be created are reported by their index in the
+    array, or by their line number in the NDJSON with blank lines counted.
+    """
+    app.logger.info("Request to Create pets in bulk")
+    items, locations = get_bulk_items()
+
+    pets, invalid = Pet.deserialize_many(items)
+    errors = [
+        {**locations[index], "message": "Invalid pet: " + format_errors(fields), "fields": fields}
+        for index, fields in invalid
+    ]
+
+    created = Pet.create_many(pets, app.config["BULK_CHUNK_SIZE"])
+    app.logger.info("Created %d pets with %d errors", len(created), len(errors))
+
+    results = {"created": [pet.serialize() for pet in created], "errors": errors}
+    if errors and not created:
+        return results, status.HTTP_400_BAD_REQUEST
+    return results, status.HTTP_201_CREATED
 
 
 ######################################################################
@@ -164,12 +329,16 @@ def update_pets(pet_id):
     """
     Update a Pet
 
-    This endpoint will update a Pet based the body that is posted
+    This endpoint will update a Pet based the body that is posted.
+    Send the Pet's ETag in If-Match to have the update rejected with 412
+    if someone else changed the Pet first.
     """
     app.logger.info("Request to update pet with id: %s", pet_id)
     check_content_type("application/json")
 
     pet = Pet.find(pet_id)
+    # a conditional update of a Pet that is gone fails its precondition
+    check_if_match(pet)
     if not pet:
         abort(status.HTTP_404_NOT_FOUND, f"Pet with id '{pet_id}' was not found.")
 
@@ -178,7 +347,7 @@ def update_pets(pet_id):
     pet.update()
 
     app.logger.info("Pet with ID [%s] updated.", pet.id)
-    return pet.serialize(), status.HTTP_200_OK
+    return pet.serialize(), status.HTTP_200_OK, {"ETag": quote_etag(pet_etag(pet))}
 
 
 ######################################################################
@@ -189,10 +358,12 @@ def delete_pets(pet_id):
     """
     Delete a Pet
 
-    This endpoint will delete a Pet based the id specified in the path
+    This endpoint will delete a Pet based the id specified in the path.
+    Send the Pet's ETag in If-Match to only delete that version of it.
     """
     app.logger.info("Request to delete pet with id: %s", pet_id)
     pet = Pet.find(pet_id)
+    check_if_match(pet)
     if pet:
         pet.delete()
 
@@ -203,21 +374,19 @@ def delete_pets(pet_id):
 ######################################################################
 # PURCHASE A PET
 ######################################################################
-@app.route("/pets/<pet_id>/purchase", methods=["PUT"])
+@app.route("/pets/<int:pet_id>/purchase", methods=["PUT"])
 def purchase_pets(pet_id):
     """Endpoint to Purchase a Pet"""
     app.logger.info("Request to Purchase pet with id: %s", pet_id)
 
-    pet = Pet.find(pet_id)
+    pet = Pet.purchase(pet_id)
     if not pet:
-        abort(status.HTTP_404_NOT_FOUND, f"Pet with id '{pet_id}' was not found.")
-
-    if not pet.available:
+        # only a failed purchase needs to look up why it failed
+        if not Pet.find(pet_id):
+            abort(status.HTTP_404_NOT_FOUND, f"Pet with id '{pet_id}' was not found.")
         abort(status.HTTP_409_CONFLICT, f"Pet with id '{pet_id}' is not available.")
 
-    pet.available = False
-    pet.update()
-    return pet.serialize(), status.HTTP_200_OK
+    return pet.serialize(), status.HTTP_200_OK, {"ETag": quote_etag(pet_etag(pet))}
 
 
 ######################################################################
@@ -225,6 +394,255 @@ def purchase_pets(pet_id):
 ######################################################################
 
 
+def pet_etag(pet: Pet) -> str:
+    """Returns a strong ETag for a Pet computed from its row version"""
+    return f"{pet.id}-{pet.version}"
+
+
+def fields_etag(pet_id: int, version: int, fields: list) -> str:
+    """Returns a strong ETag for some of the fields of a Pet
+
+    It differs from pet_etag() since it tags another representation of the
+    same version of the Pet.
+    """
+    return f"{pet_id}-{version}-{'.'.join(fields)}"
+
+
+def pets_etag(query) -> str:
+    """Returns a strong ETag for a list of Pets
+
+    The ETag is computed from an aggregate of the rows in the query, which
+    is a single page unless pagination is off, the PetStats change counter
+    and the query string rather than from the serialized Pets
+    """
+    summary = Pet.summarize(query)
+    args = sorted(request.args.items(multi=True))
+    return hashlib.sha256(repr((summary, args)).encode()).hexdigest()
+
+
+def count_by(groups: list, key: str) -> dict:
+    """Adds up the counts of the PetStats groups by one of their keys"""
+    counts = {}
+    for group in groups:
+        value = json.dumps(group[key]) if isinstance(group[key], bool) else group[key]
+        counts[value] = counts.get(value, 0) + group["count"]
+    return counts
+
+
+def get_pet_filters(args) -> dict:
+    """Returns the Pet filters supplied in the query string args
+
+    Every filter that is supplied is returned so that they can all be
+    combined into a single query.
+    """
+    filters = {}
+    for key in ["category", "name"]:
+        if args.get(key):
+            filters[key] = args[key]
+
+    available = args.get("available")
+    if available:
+        filters["available"] = available.lower() in ["yes", "y", "true", "t", "1"]
+
+    gender_name = args.get("gender")
+    if gender_name:
+        if gender_name not in Gender.__members__:
+            abort(status.HTTP_400_BAD_REQUEST, f"Invalid gender: {gender_name}")
+        filters["gender"] = Gender[gender_name]  # create enum from string
+
+    return filters
+
+
+def get_fields(args) -> list:
+    """Returns the serialized fields asked for with ?fields= or None for all of them
+
+    The id is always included since it identifies the Pet and pages are
+    keyed on it. The fields are returned in the order Pet.serialize() uses.
+    """
+    if "fields" not in args:
+        return None
+    wanted = {field.strip() for field in args["fields"].split(",")} - {""}
+    unknown = wanted - set(ROW_FIELDS)
+    if unknown:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            f"Unknown fields: {', '.join(sorted(unknown))}, use {', '.join(ROW_FIELDS)}",
+        )
+    wanted.add("id")
+    return [field for field in ROW_FIELDS if field in wanted]
+
+
+def get_bulk_items() -> tuple:
+    """Returns the list of Pets posted as a JSON array or as NDJSON and where each one was
+
+    Each Pet is located by its "index" in the array or by the "line" of the
+    NDJSON it was on. NDJSON lines that are not valid JSON are returned as
+    None so that they are reported as errors along with any other invalid Pets.
+    """
+    if request.mimetype not in ["application/json", "application/x-ndjson"]:
+        abort(
+            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            "Content-Type must be application/json or application/x-ndjson",
+        )
+
+    if request.mimetype == "application/json":
+        items = request.get_json()
+        if not isinstance(items, list):
+            abort(status.HTTP_400_BAD_REQUEST, "Request body must be a JSON array of pets")
+        return items, [{"index": index} for index in range(len(items))]
+
+    items = []
+    locations = []
+    for number, line in enumerate(request.get_data(as_text=True).splitlines(), start=1):
+        if line.strip():
+            locations.append({"line": number})
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+    return items, locations
+
+
+def get_limit(default: int) -> int:
+    """Returns the ?limit= from the query string, capped at PAGE_SIZE_MAX"""
+    limit = default
+    if "limit" in request.args:
+        limit = request.args.get("limit", type=int)
+    if limit is None or limit < 1:
+        abort(status.HTTP_400_BAD_REQUEST, "limit must be a positive integer")
+    return min(limit, app.config["PAGE_SIZE_MAX"])
+
+
+def get_pet_fields(pet_id: int, fields: list):
+    """Returns only some of the fields of a Pet with an ETag for them"""
+    found = Pet.find_fields(pet_id, fields)
+    if not found:
+        abort(status.HTTP_404_NOT_FOUND, f"Pet with id '{pet_id}' was not found.")
+    data, version = found
+
+    etag = fields_etag(pet_id, version, fields)
+    if request.if_none_match.contains_weak(etag):
+        app.logger.info("Pet with ID [%s] not modified", pet_id)
+        return "", status.HTTP_304_NOT_MODIFIED, {"ETag": quote_etag(etag)}
+    return data, status.HTTP_200_OK, {"ETag": quote_etag(etag)}
+
+
+def search_pets(filters: dict, fields: list):
+    """Returns the Pets whose names best match ?name_prefix= or ?name_fuzzy="""
+    fuzzy = "name_fuzzy" in request.args
+    text = request.args.get("name_fuzzy" if fuzzy else "name_prefix", "").strip()
+    if not text:
+        abort(status.HTTP_400_BAD_REQUEST, "name_fuzzy or name_prefix must not be empty")
+    limit = get_limit(app.config["SEARCH_LIMIT_DEFAULT"])
+
+    results = Pet.search_by_name(text, fuzzy=fuzzy, limit=limit, fields=fields, **filters)
+    app.logger.info("Returning %d pets", len(results))
+    return results, status.HTTP_200_OK
+
+
+def paginate_pets(page_query, limit: int, fields: list = None):
+    """Returns a page of serialized Pets and the headers for the next page
+
+    The page_query has to fetch limit + 1 rows so that the extra row tells
+    if there is a next page.
+    """
+    pets = list(Pet.serialize_query(page_query, fields=fields))
+    if len(pets) <= limit:
+        return pets, {}
+
+    pets = pets[:limit]
+    args = request.args.to_dict()
+    args.update(limit=limit, cursor=encode_cursor(pets[-1]["id"]))
+    next_url = url_for("list_pets", _external=True, **args)
+    return pets, {"Link": f'<{next_url}>; rel="next"'}
+
+
+def stream_pets(query, fields: list = None) -> Response:
+    """Streams the Pets in the query as a JSON array
+
+    Rows are read from a server-side cursor in batches of STREAM_YIELD_PER and
+    each batch is written out as soon as it is serialized, so memory stays
+    flat no matter how many Pets match.
+    """
+    batch_size = app.config["STREAM_YIELD_PER"]
+    pets = Pet.serialize_query(query.order_by(Pet.id), yield_per=batch_size, fields=fields)
+
+    def generate():
+        yield "["
+        batch = []
+        separator = ""
+        for pet in pets:
+            batch.append(separator + app.json.dumps(pet))
+            separator = ","
+            if len(batch) >= batch_size:
+                yield "".join(batch)
+                batch = []
+        yield "".join(batch) + "]"
+
+    return Response(
+        stream_with_context(generate()),
+        status=status.HTTP_200_OK,
+        mimetype="application/json",
+    )
+
+
+def encode_cursor(pet_id: int) -> str:
+    """Encodes the id of the last Pet on a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(str(pet_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Decodes an opaque cursor back into the id of the last Pet on a page"""
+    pet_id = None
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        pet_id = int(base64.urlsafe_b64decode(cursor + padding).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid cursor: {cursor}")
+    return pet_id
+
+
+def send_asset(path: str) -> Response:
+    """Sends a static file in the best encoding that the client accepts
+
+    A fingerprinted path never changes, so it may be cached for good. Any
+    other path has to be revalidated with its ETag before it is reused.
+    """
+    asset, fingerprinted = static_assets.get(path)
+    if asset is None:
+        abort(status.HTTP_404_NOT_FOUND, f"File '{path}' was not found.")
+
+    encoding = choose_encoding(tuple(key for key in asset.encodings if key))
+    response = Response(asset.encodings[encoding], mimetype=asset.mimetype)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if len(asset.encodings) > 1:
+        response.vary.add("Accept-Encoding")
+    response.set_etag(asset.etag(encoding))
+    if fingerprinted:
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config["STATIC_MAX_AGE"]
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def check_if_match(pet: Pet) -> None:
+    """Checks that the Pet is the version given in the If-Match header"""
+    if not request.if_match:
+        return  # unconditional request
+
+    if pet and request.if_match.contains(pet_etag(pet)):
+        return  # version OK
+
+    app.logger.warning("If-Match %s failed for pet %s", request.if_match, pet)
+    abort(
+        status.HTTP_412_PRECONDITION_FAILED,
+        "Pet has been changed since it was read. Fetch it again and retry.",
+    )
+
+
 def check_content_type(media_type: str) -> None:
     """Checks that the media type is correct"""
     content_type = request.headers.get("Content-Type")
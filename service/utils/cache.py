@@ -0,0 +1,123 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+LRU Cache
+
+This module contains a small in-process cache that evicts the least
+recently used entries once it is full and expires entries after a TTL
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """A thread safe, size bounded LRU cache with a time to live
+
+    A max_size of 0 disables the cache. Each process has its own cache so
+    with several workers an entry can be stale for up to ttl seconds after
+    another worker changes it. Within a process an invalidated key is
+    remembered for ttl seconds, so that a value read before the change is
+    not cached after it.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 30.0):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._invalidated = OrderedDict()  # key -> time.monotonic() it was invalidated
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, max_size: int, ttl: float) -> None:
+        """Resizes the cache and sets a new time to live"""
+        with self._lock:
+            self.max_size = max_size
+            self.ttl = ttl
+            self._evict()
+
+    def get(self, key):
+        """Returns the value cached for key or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, read_at: float = None) -> None:
+        """Caches value for key, evicting the least recently used entries
+
+        Pass the time.monotonic() from before value was read as read_at to
+        leave it out if key was invalidated since, as it may be older than
+        what the change that invalidated it wrote.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            invalidated = self._invalidated.get(key)
+            if read_at is not None and invalidated is not None and invalidated >= read_at:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def invalidate(self, key) -> None:
+        """Removes the entry for key if there is one and remembers when it was invalidated"""
+        if self.max_size <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._invalidated[key] = now
+            self._invalidated.move_to_end(key)
+            # reads take far less than the ttl, so older invalidations are forgotten
+            while next(iter(self._invalidated.values())) < now - self.ttl:
+                self._invalidated.popitem(last=False)
+
+    def clear(self) -> None:
+        """Removes all of the entries and resets the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._invalidated.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> dict:
+        """Returns the size of the cache and its hit and miss counters"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self) -> None:
+        """Drops least recently used entries until the cache fits (lock must be held)"""
+        while len(self._entries) > max(self.max_size, 0):
+            self._entries.popitem(last=False)
+            self.evictions += 1
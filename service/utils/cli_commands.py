@@ -2,7 +2,8 @@
 Flask CLI Command Extensions
 """
 from service import app
-from service.models import db
+from service.models import db, create_tables, create_indexes as create_missing_indexes
+from service.pet_stats import PetStats
 
 
 ######################################################################
@@ -18,3 +19,44 @@ def create_db():
     db.drop_all()
     db.create_all()
     db.session.commit()
+
+
+######################################################################
+# Command to create the tables before the workers start
+# Usage: flask init-db
+######################################################################
+@app.cli.command("init-db")
+def init_db():
+    """
+    Creates any tables and indexes that are missing from the database.
+    Existing tables and data are left untouched so this is safe to run
+    on every deployment.
+    """
+    create_tables()
+
+
+######################################################################
+# Command to add missing indexes to an existing database
+# Usage: flask create-indexes
+######################################################################
+@app.cli.command("create-indexes")
+def create_indexes():
+    """
+    Creates any indexes that are missing from an existing database.
+    Existing tables and data are left untouched.
+    """
+    create_missing_indexes()
+
+
+######################################################################
+# Command to recount the Pet statistics
+# Usage: flask rebuild-stats
+######################################################################
+@app.cli.command("rebuild-stats")
+def rebuild_stats():
+    """
+    Recounts the Pets in every PetStats group. Run this once after
+    creating the pet_stats table on an existing database, or after
+    changing Pets without going through the models.
+    """
+    PetStats.rebuild()
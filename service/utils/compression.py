@@ -0,0 +1,84 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Module: compression
+
+Compresses JSON responses with the best encoding the client accepts.
+Brotli is used when the brotli package is installed, otherwise gzip.
+Responses smaller than COMPRESS_MIN_SIZE are sent as they are since the
+saving would not be worth the time, and so are streamed responses whose
+size is not known up front.
+"""
+import gzip
+from flask import current_app, request
+from service import app
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Content encodings in order of preference
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    """Compresses data with a content encoding at a level from 1 (fastest) to 9 (smallest)"""
+    if encoding == "br":
+        # brotli qualities run from 0 to 11
+        return brotli.compress(data, quality=min(level + 2, 11))
+    # a fixed mtime keeps the output, and so any ETag of it, the same every time
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def choose_encoding(encodings: tuple = ENCODINGS):
+    """Returns the encoding the request accepts that we like best, or None for identity"""
+    return request.accept_encodings.best_match(encodings)
+
+
+######################################################################
+# Request Hooks
+######################################################################
+@app.after_request
+def compress_response(response):
+    """Compresses JSON responses that are large enough and not compressed already"""
+    if not current_app.config["COMPRESS_RESPONSES"] or response.mimetype not in current_app.config["COMPRESS_MIMETYPES"]:
+        return response
+    response.vary.add("Accept-Encoding")
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < current_app.config["COMPRESS_MIN_SIZE"]:
+        return response
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding, current_app.config["COMPRESS_LEVEL"]))
+    response.headers["Content-Encoding"] = encoding
+    # the compressed bytes are a different representation, so a strong
+    # ETag of the uncompressed body no longer applies to them
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,97 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Database Connection Pool
+
+This module contains utility functions to configure the SQLAlchemy
+connection pool and report how busy it is
+"""
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+# Options that only apply to a QueuePool
+QUEUE_POOL_OPTIONS = ["pool_size", "max_overflow", "pool_timeout"]
+
+
+class TimedQueuePool(QueuePool):
+    """A QueuePool that records how long callers wait for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def connect(self):
+        """Checks out a connection and records the time it took"""
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            wait_time = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_time_total += wait_time
+                self.wait_time_max = max(self.wait_time_max, wait_time)
+
+    def stats(self) -> dict:
+        """Returns the connection counts and wait times of the pool"""
+        with self._stats_lock:
+            return {
+                "pool_size": self.size(),
+                "max_overflow": self._max_overflow,
+                "checked_out": self.checkedout(),
+                "idle": self.checkedin(),
+                # overflow() counts up from -pool_size until the pool is full
+                "overflow": max(self.overflow(), 0),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_time_total": self.wait_time_total,
+                "wait_time_max": self.wait_time_max,
+            }
+
+
+def engine_options(uri: str, options: dict) -> dict:
+    """Returns the engine options to use for a database uri
+
+    In-memory SQLite shares one static connection, so it has no pool
+    to size. Every other database gets a TimedQueuePool.
+    """
+    options = dict(options)
+    url = make_url(uri)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        for option in QUEUE_POOL_OPTIONS:
+            options.pop(option, None)
+    else:
+        options.setdefault("poolclass", TimedQueuePool)
+    return options
+
+
+def pool_stats(pool) -> dict:
+    """Returns the statistics for a connection pool"""
+    if isinstance(pool, TimedQueuePool):
+        return pool.stats()
+    return {"status": pool.status()}
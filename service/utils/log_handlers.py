@@ -20,19 +20,132 @@ Log Handlers
 This module contains utility functions to set up logging
 consistently
 """
+import atexit
+import copy
 import logging
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context
+
+# formats the tracebacks of queued records when the handler has no formatter
+TRACEBACK_FORMATTER = logging.Formatter()
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queues log records for a background writer and drops them when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self.listener = None
+
+    def prepare(self, record):
+        """Merges the message arguments but leaves the formatting to the writer"""
+        # the arguments are read now while it is still safe to, the timestamp
+        # is formatted later on the background thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # like QueueHandler, only queue the text of a traceback, which
+            # would otherwise keep every frame and its locals alive
+            if not record.exc_text:
+                record.exc_text = (self.formatter or TRACEBACK_FORMATTER).formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        """Queues the record without blocking, counting it if it is dropped"""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+
+class RequestLogSampler(logging.Filter):
+    """Keeps only a sample of the info logs written while handling requests
+
+    The decision is made once per request so a sampled request keeps all
+    of its log lines. Warnings, errors and logs outside of a request are
+    always kept.
+    """
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or not has_request_context():
+            return True
+        if "log_sampled" not in g:
+            g.log_sampled = random.random() < self.rate
+        return g.log_sampled
+
+
+def forget_log_sample(_exception=None):
+    """Lets the next request be sampled on its own even if it shares the app context"""
+    g.pop("log_sampled", None)
 
 
 def init_logging(app, logger_name: str):
-    """Set up logging for production"""
+    """Set up logging for production
+
+    Records are put on a bounded queue and written by a background thread
+    so that requests never wait on log I/O.
+    """
     app.logger.propagate = False
     gunicorn_logger = logging.getLogger(logger_name)
-    app.logger.handlers = gunicorn_logger.handlers
+    handlers = gunicorn_logger.handlers
     app.logger.setLevel(gunicorn_logger.level)
     # Make all log formats consistent
     formatter = logging.Formatter(
         "[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z"
     )
-    for handler in app.logger.handlers:
+    for handler in handlers:
         handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=app.config["LOG_QUEUE_SIZE"]))
+    queue_handler.addFilter(RequestLogSampler(app.config["LOG_SAMPLE_RATE"]))
+    app.teardown_request(forget_log_sample)
+    queue_handler.listener = start_listener(queue_handler.queue, handlers)
+    app.logger.handlers = [queue_handler]
     app.logger.info("Logging handler established")
+
+
+def start_listener(log_queue: queue.Queue, handlers: list) -> QueueListener:
+    """Starts a background thread that writes the records on the queue to the handlers"""
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def restart_logging(app) -> None:
+    """Restarts the background log writer in a forked worker
+
+    Threads do not survive a fork, so a worker forked from a preloaded app
+    inherits the log queue but nothing that writes it. The worker gets a
+    new queue, so records left over from the parent are not written twice,
+    and a new writer thread.
+    """
+    for handler in app.logger.handlers:
+        if isinstance(handler, DroppingQueueHandler) and handler.listener:
+            atexit.unregister(handler.listener.stop)
+            handler.queue = queue.Queue(maxsize=handler.queue.maxsize)
+            handler.listener = start_listener(handler.queue, handler.listener.handlers)
+
+
+def stats(app) -> dict:
+    """Returns the size of the log queue and how many records were dropped"""
+    for handler in app.logger.handlers:
+        if isinstance(handler, DroppingQueueHandler):
+            return {
+                "queued": handler.queue.qsize(),
+                "max_queued": handler.queue.maxsize,
+                "dropped": handler.dropped,
+            }
+    return {}
@@ -0,0 +1,104 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Module: metrics
+
+Records the latency, size and concurrency of every request in the
+Prometheus text format. When PROMETHEUS_MULTIPROC_DIR is set each gunicorn
+worker writes its samples to that directory and /metrics aggregates all
+of the workers.
+"""
+import os
+import time
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from service import app
+
+REQUEST_LATENCY = Histogram(
+    "pet_service_request_duration_seconds",
+    "Time spent handling a request",
+    ["method", "route", "status"],
+)
+RESPONSE_SIZE = Histogram(
+    "pet_service_response_size_bytes",
+    "Size of the response body",
+    ["method", "route", "status"],
+    buckets=(100, 1000, 10_000, 100_000, 1_000_000, 10_000_000),
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "pet_service_requests_in_progress",
+    "Requests that are being handled right now",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+
+
+def route_label() -> str:
+    """Returns the route rule so that every Pet id shares one label"""
+    if request.url_rule is None:
+        return "unmatched"
+    return request.url_rule.rule
+
+
+def export():
+    """Returns the metrics of every worker in the Prometheus text format"""
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), {"Content-Type": CONTENT_TYPE_LATEST}
+
+
+######################################################################
+# Request Hooks
+######################################################################
+@app.before_request
+def start_request_timer():
+    """Starts timing the request and counts it as in progress"""
+    g.metrics_start = time.perf_counter()
+    g.metrics_route = route_label()
+    REQUESTS_IN_PROGRESS.labels(request.method, g.metrics_route).inc()
+
+
+@app.after_request
+def record_request(response):
+    """Records the latency and size of the response"""
+    start = g.pop("metrics_start", None)
+    if start is not None:
+        labels = (request.method, g.metrics_route, response.status_code)
+        REQUEST_LATENCY.labels(*labels).observe(time.perf_counter() - start)
+        # streamed responses have no length until they have been sent
+        size = response.calculate_content_length()
+        if size is not None:
+            RESPONSE_SIZE.labels(*labels).observe(size)
+    return response
+
+
+@app.teardown_request
+def finish_request(_error=None):
+    """Stops counting the request as in progress even if it failed"""
+    route = g.pop("metrics_route", None)
+    if route is not None:
+        REQUESTS_IN_PROGRESS.labels(request.method, route).dec()
@@ -0,0 +1,224 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Name Index
+
+This module contains an in-process index of names for prefix and fuzzy
+search on databases that have no trigram indexes, like SQLite. Fuzzy
+search ranks names by trigram similarity the same way PostgreSQL's
+pg_trgm does.
+"""
+import bisect
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+# pg_trgm's default similarity_threshold
+SIMILARITY_THRESHOLD = 0.3
+
+WORD = re.compile(r"[^\W_]+")
+
+
+def trigrams(text: str) -> frozenset:
+    """Returns the trigrams of a string the way pg_trgm makes them
+
+    Every lower case word is padded with two spaces in front and one
+    behind, and anything that is not a letter or digit separates words.
+    """
+    result = set()
+    for word in WORD.findall(text.lower()):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(result)
+
+
+class NameIndex:
+    """A thread safe index from names to ids for prefix and trigram search
+
+    Many Pets share a name, so the index is kept over the distinct lower
+    case names: a sorted list of them for prefix search and an inverted
+    index of their trigrams for fuzzy search. Each process has its own
+    index, so changes made by other workers are only seen after it is
+    rebuilt, which happens once it is older than ttl seconds.
+    """
+
+    def __init__(self, ttl: float = 300.0):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._pending = None  # changes made while it is being rebuilt
+        self.ttl = ttl
+        self.built_at = None
+        self._ids = {}  # lower case name -> set of ids
+        self._names = []  # sorted lower case names
+        self._trigrams = {}  # trigram -> set of lower case names
+        self._sizes = {}  # lower case name -> number of trigrams
+
+    def configure(self, ttl: float) -> None:
+        """Sets how long the index is used before it is rebuilt (0 for never)"""
+        self.ttl = ttl
+
+    def is_stale(self) -> bool:
+        """Returns True if the index has to be built before it is used"""
+        if self.built_at is None:
+            return True
+        return bool(self.ttl) and time.monotonic() - self.built_at > self.ttl
+
+    def refresh(self, load) -> None:
+        """Rebuilds the index from the rows that load() returns if it is stale
+
+        Only one thread rebuilds the index at a time. Until it is first built
+        the other threads wait for it, after that they keep using the stale
+        index instead of waiting or loading every name again themselves.
+        """
+        if not self.is_stale():
+            return
+        if not self._build_lock.acquire(blocking=self.built_at is None):
+            return  # another thread is rebuilding it
+        try:
+            if self.is_stale():
+                with self._lock:
+                    self._pending = []
+                self.rebuild(load())
+        finally:
+            with self._lock:
+                self._pending = None
+            self._build_lock.release()
+
+    def rebuild(self, rows) -> None:
+        """Replaces the contents of the index with rows of (id, name)"""
+        ids = {}
+        for pet_id, name in rows:
+            ids.setdefault(name.lower(), set()).add(pet_id)
+        index = {}
+        sizes = {}
+        for name in ids:
+            name_trigrams = trigrams(name)
+            sizes[name] = len(name_trigrams)
+            for trigram in name_trigrams:
+                index.setdefault(trigram, set()).add(name)
+        with self._lock:
+            self._ids = ids
+            self._names = sorted(ids)
+            self._trigrams = index
+            self._sizes = sizes
+            # the rows may have been read before these were committed
+            for change in self._pending or ():
+                self._move(*change)
+            self._pending = None
+            self.built_at = time.monotonic()
+
+    def clear(self) -> None:
+        """Empties the index so that it is rebuilt before it is used again"""
+        with self._lock:
+            self._ids = {}
+            self._names = []
+            self._trigrams = {}
+            self._sizes = {}
+            self.built_at = None
+
+    def update(self, pet_id: int, old_name: str = None, new_name: str = None) -> None:
+        """Moves an id from its old name to its new one, either may be None"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((pet_id, old_name, new_name))
+            if self.built_at is not None:
+                self._move(pet_id, old_name, new_name)
+
+    def prefix(self, text: str):
+        """Returns a generator of the ids of the names starting with text
+
+        The ids are ordered by lower case name and then by id.
+        """
+        text = text.lower()
+        with self._lock:
+            start = bisect.bisect_left(self._names, text)
+            end = bisect.bisect_left(self._names, text + "\U0010ffff", start)
+            names = self._names[start:end]
+        return self._ids_of(names)
+
+    def fuzzy(self, text: str, threshold: float = SIMILARITY_THRESHOLD):
+        """Returns a generator of the ids of the names similar to text
+
+        The ids are ordered by trigram similarity, best first, and then by
+        name and id. Names less similar than threshold are left out.
+        """
+        wanted = trigrams(text)
+        # a name has to share at least threshold * len(wanted) trigrams, so
+        # it must have one of the rarest len(wanted) - minimum + 1 of them
+        # and the most common trigrams only need to be checked against
+        # those candidates rather than counted for every name they are in
+        minimum = max(math.ceil(threshold * len(wanted) - 1e-9), 1)
+        with self._lock:
+            postings = sorted((self._trigrams.get(trigram, ()) for trigram in wanted), key=len)
+            split = len(postings) - minimum + 1
+            shared = Counter()
+            for names in postings[:split]:
+                shared.update(names)
+            for names in postings[split:]:
+                shared.update(shared.keys() & names)
+            sizes = {name: self._sizes[name] for name in shared}
+        ranked = []
+        for name, count in shared.items():
+            similarity = count / (len(wanted) + sizes[name] - count)
+            if similarity >= threshold:
+                ranked.append((-similarity, name))
+        ranked.sort()
+        return self._ids_of([name for _, name in ranked])
+
+    ##################################################
+    # PRIVATE METHODS
+    ##################################################
+
+    def _ids_of(self, names: list):
+        """Yields the sorted ids of each name in turn"""
+        for name in names:
+            with self._lock:
+                ids = sorted(self._ids.get(name, ()))
+            yield from ids
+
+    def _move(self, pet_id: int, old_name: str, new_name: str) -> None:
+        """Moves an id from its old name to its new one, the lock must be held"""
+        if old_name is not None:
+            self._remove(pet_id, old_name.lower())
+        if new_name is not None:
+            self._add(pet_id, new_name.lower())
+
+    def _add(self, pet_id: int, name: str) -> None:
+        """Adds an id to a name, the lock must be held"""
+        if name not in self._ids:
+            self._ids[name] = set()
+            bisect.insort(self._names, name)
+            name_trigrams = trigrams(name)
+            self._sizes[name] = len(name_trigrams)
+            for trigram in name_trigrams:
+                self._trigrams.setdefault(trigram, set()).add(name)
+        self._ids[name].add(pet_id)
+
+    def _remove(self, pet_id: int, name: str) -> None:
+        """Removes an id from a name, the lock must be held"""
+        ids = self._ids.get(name)
+        if ids is None:
+            return
+        ids.discard(pet_id)
+        if not ids:
+            del self._ids[name]
+            del self._names[bisect.bisect_left(self._names, name)]
+            del self._sizes[name]
+            for trigram in trigrams(name):
+                self._trigrams[trigram].discard(name)
@@ -0,0 +1,115 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Module: query_stats
+
+Times every SQL statement through SQLAlchemy engine events. The number of
+statements a request ran and the time they took are returned in the
+X-Query-Count and X-Query-Time-Ms response headers, except for streamed
+responses whose statements run after the headers are sent, and any
+statement slower than SLOW_QUERY_THRESHOLD_MS is written to a structured
+slow query log.
+"""
+import json
+import logging
+import time
+from flask import g, has_app_context, has_request_context, current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from service import app
+
+logger = logging.getLogger("flask.app")
+
+
+def parameters_shape(parameters):
+    """Returns the shape of the statement parameters without their values
+
+    Only the names and types are logged so that no data ends up in the logs
+    """
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany: log the shape of the first row and how many rows there were
+            return {"rows": len(parameters), "row": parameters_shape(parameters[0])}
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+######################################################################
+# Engine Events
+######################################################################
+# pylint: disable=too-many-arguments, unused-argument
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    """Remembers when the statement started"""
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    """Counts the statement against the request and logs it if it was slow"""
+    elapsed_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+
+    if has_request_context() and "query_count" in g:
+        g.query_count += 1
+        g.query_time_ms += elapsed_ms
+
+    if has_app_context() and elapsed_ms >= current_app.config["SLOW_QUERY_THRESHOLD_MS"]:
+        entry = {
+            "event": "slow_query",
+            "duration_ms": round(elapsed_ms, 3),
+            "statement": statement,
+            "parameters": parameters_shape(parameters),
+            "executemany": executemany,
+        }
+        if has_request_context():
+            entry["method"] = request.method
+            entry["path"] = request.path
+        logger.warning(json.dumps(entry))
+# pylint: enable=too-many-arguments, unused-argument
+
+
+@event.listens_for(Engine, "handle_error")
+def forget_failed_query(context):
+    """Drops the start time of a statement that failed
+
+    after_cursor_execute never runs for it, so the start time would
+    otherwise stay on the pooled connection and be taken for the next
+    statement's.
+    """
+    if context.connection is not None:
+        context.connection.info.pop("query_start", None)
+
+
+######################################################################
+# Request Hooks
+######################################################################
+@app.before_request
+def start_query_count():
+    """Starts counting the statements run by this request"""
+    g.query_count = 0
+    g.query_time_ms = 0.0
+
+
+@app.after_request
+def add_query_headers(response):
+    """Reports the statements run by this request in the response headers"""
+    if "query_count" in g and not response.is_streamed:
+        response.headers["X-Query-Count"] = str(g.query_count)
+        response.headers["X-Query-Time-Ms"] = f"{g.query_time_ms:.3f}"
+    return response
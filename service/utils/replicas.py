@@ -0,0 +1,173 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Module: replicas
+
+Spreads the reads of GET requests over read replicas of the database.
+Replicas are picked round robin, and one that cannot be reached is left
+out for REPLICA_EJECT_SECONDS before it is tried again. A client that
+wrote is given a cookie that sends its reads to the primary for the next
+REPLICA_STICKY_SECONDS, so it always reads its own writes even if the
+replicas are behind.
+"""
+import logging
+import math
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import create_engine, event
+from service import app
+from service.utils.db_pool import engine_options, pool_stats
+
+logger = logging.getLogger("flask.app")
+
+# Requests whose statements may be sent to a replica
+READ_METHODS = ["GET", "HEAD"]
+
+# Cookie with the time until which the client reads from the primary
+STICKY_COOKIE = "read_primary_until"
+
+
+class ReplicaRouter:
+    """Picks the replica for a read, round robin, skipping replicas that failed"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.engines = []
+        self.eject_seconds = 30.0
+        self._next = 0
+        self._ejected_until = {}  # index -> time.monotonic() it may be used again
+        self._reads = []
+        self._ejections = []
+
+    def configure(self, uris: list, options: dict, eject_seconds: float) -> None:
+        """Creates an engine for each replica uri with the same options as the primary"""
+        self.dispose()
+        engines = []
+        for uri in uris:
+            engine = create_engine(uri, **engine_options(uri, options))
+            event.listen(engine, "handle_error", self._handle_error)
+            engines.append(engine)
+        with self._lock:
+            self.engines = engines
+            self.eject_seconds = eject_seconds
+            self._next = 0
+            self._ejected_until = {}
+            self._reads = [0] * len(engines)
+            self._ejections = [0] * len(engines)
+
+    def choose(self):
+        """Returns the engine of the next healthy replica, or None if there is none"""
+        with self._lock:
+            now = time.monotonic()
+            for _ in range(len(self.engines)):
+                index = self._next
+                self._next = (index + 1) % len(self.engines)
+                if self._ejected_until.get(index, 0) <= now:
+                    self._reads[index] += 1
+                    return self.engines[index]
+        return None
+
+    def eject(self, engine) -> None:
+        """Leaves a replica out until eject_seconds have passed"""
+        with self._lock:
+            index = self.engines.index(engine)
+            self._ejected_until[index] = time.monotonic() + self.eject_seconds
+            self._ejections[index] += 1
+        logger.warning("Replica %s ejected for %ss", engine.url.render_as_string(), self.eject_seconds)
+
+    def dispose(self, close: bool = True) -> None:
+        """Empties the connection pools of the replicas"""
+        for engine in self.engines:
+            engine.dispose(close=close)
+
+    def stats(self) -> list:
+        """Returns the health, reads and pool statistics of each replica"""
+        with self._lock:
+            now = time.monotonic()
+            return [
+                {
+                    "url": engine.url.render_as_string(),
+                    "healthy": self._ejected_until.get(index, 0) <= now,
+                    "reads": self._reads[index],
+                    "ejections": self._ejections[index],
+                    "pool": pool_stats(engine.pool),
+                }
+                for index, engine in enumerate(self.engines)
+            ]
+
+    def _handle_error(self, context) -> None:
+        """Ejects a replica when it cannot be connected to"""
+        if context.connection is None or context.is_disconnect:
+            self.eject(context.engine)
+
+
+def request_replica(router: ReplicaRouter):
+    """Returns the replica engine for the reads of this request, or None for the primary
+
+    The replica is picked once per request so that all of its reads see
+    the same data.
+    """
+    if not router.engines or not has_request_context() or request.method not in READ_METHODS:
+        return None
+    if "db_replica" not in g:
+        g.db_replica = None if wrote_recently() else router.choose()
+    return g.db_replica
+
+
+def read_from_replica() -> bool:
+    """Returns True if the reads of this request went to a replica, which may be behind"""
+    return has_request_context() and g.get("db_replica") is not None
+
+
+def wrote_recently() -> bool:
+    """Returns True if the client wrote within the last REPLICA_STICKY_SECONDS"""
+    if not has_request_context():
+        return False
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+######################################################################
+# Request Hooks
+######################################################################
+@app.after_request
+def stick_to_primary(response):
+    """Sends the reads of a client that just wrote to the primary for a while"""
+    seconds = current_app.config["REPLICA_STICKY_SECONDS"]
+    if (
+        current_app.config["DATABASE_REPLICA_URIS"]
+        and seconds > 0
+        and request.method not in READ_METHODS
+        and response.status_code < 400
+    ):
+        response.set_cookie(
+            STICKY_COOKIE,
+            f"{time.time() + seconds:.3f}",
+            max_age=math.ceil(seconds),
+            httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
+@app.teardown_request
+def forget_replica(_exception=None):
+    """Lets the next request pick its own replica even if it shares the app context"""
+    g.pop("db_replica", None)
@@ -0,0 +1,157 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Declarative Schemas
+
+This module contains small field types and a Schema that compiles them
+once into a validator. A Schema checks every field of a payload and
+reports all of the errors instead of stopping at the first one.
+"""
+from datetime import date
+
+
+class String:
+    """A string with an optional maximum length"""
+
+    def __init__(self, max_length: int = None):
+        self.max_length = max_length
+
+    def compile(self):
+        """Returns a function that converts a value or raises ValueError"""
+        max_length = self.max_length
+
+        def convert(value):
+            if not isinstance(value, str):
+                raise ValueError(f"must be a string, not {type(value).__name__}")
+            if max_length is not None and len(value) > max_length:
+                raise ValueError(f"must be at most {max_length} characters")
+            return value
+
+        return convert
+
+
+class Boolean:
+    """A JSON boolean, strings like 'true' are not accepted"""
+
+    def compile(self):
+        """Returns a function that converts a value or raises ValueError"""
+
+        def convert(value):
+            if value is True or value is False:
+                return value
+            raise ValueError(f"must be a boolean, not {type(value).__name__}")
+
+        return convert
+
+
+class Choice:
+    """The name of a member of an Enum"""
+
+    def __init__(self, enum):
+        self.enum = enum
+
+    def compile(self):
+        """Returns a function that converts a value or raises ValueError"""
+        members = dict(self.enum.__members__)
+        names = ", ".join(members)
+
+        def convert(value):
+            try:
+                return members[value]
+            except (KeyError, TypeError):
+                raise ValueError(f"must be one of {names}, not {value!r}") from None
+
+        return convert
+
+
+class Date:
+    """A date in ISO 8601 format"""
+
+    def compile(self):
+        """Returns a function that converts a value or raises ValueError"""
+        fromisoformat = date.fromisoformat
+
+        def convert(value):
+            try:
+                return fromisoformat(value)
+            except (ValueError, TypeError):
+                raise ValueError(f"must be an ISO 8601 date, not {value!r}") from None
+
+        return convert
+
+
+class Schema:
+    """A set of named fields compiled into a validator
+
+    Every field is required. The validator is built once when the Schema
+    is created so validating a payload is a single loop over the fields.
+    """
+
+    def __init__(self, **fields):
+        self.fields = fields
+        self._converters = tuple((name, field.compile()) for name, field in fields.items())
+
+    def validate(self, data) -> tuple:
+        """
+        Validates a payload
+
+        :param data: the payload to validate
+        :type data: dict
+
+        :return: the converted values and a dict of error messages by field
+        :rtype: tuple
+        """
+        if not isinstance(data, dict):
+            return {}, {"body": f"must be an object, not {type(data).__name__}"}
+        values = {}
+        errors = {}
+        for name, convert in self._converters:
+            if name not in data:
+                errors[name] = "is missing"
+                continue
+            try:
+                values[name] = convert(data[name])
+            except ValueError as error:
+                errors[name] = str(error)
+        return values, errors
+
+    def validate_many(self, items: list) -> tuple:
+        """
+        Validates a list of payloads in one pass
+
+        :param items: the payloads to validate
+        :type items: list
+
+        :return: the list of converted values of the valid payloads and a
+            list of (index, errors) for the invalid ones
+        :rtype: tuple
+        """
+        validate = self.validate
+        valid = []
+        invalid = []
+        for index, data in enumerate(items):
+            values, errors = validate(data)
+            if errors:
+                invalid.append((index, errors))
+            else:
+                valid.append(values)
+        return valid, invalid
+
+
+def format_errors(errors: dict) -> str:
+    """Returns the errors of a payload as a single message"""
+    return "; ".join(f"{name} {message}" for name, message in errors.items())
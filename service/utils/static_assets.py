@@ -0,0 +1,122 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Static Assets
+
+This module loads the static files once, fingerprints each one with a
+hash of its contents and compresses it with every encoding ahead of time,
+so serving a file is a dictionary lookup. A fingerprinted url such as
+css/site.3f2a9c81d0e4.css never changes its contents and can be cached
+for good, and the HTML pages are rewritten to refer to those urls.
+"""
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+from service.utils.compression import ENCODINGS, compress
+
+# Files that are already compressed gain nothing from another round
+INCOMPRESSIBLE = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".woff", ".woff2", ".gz", ".br"}
+
+# The static urls referred to by href= and src= in an HTML page
+STATIC_URL = re.compile(r"""((?:href|src)\s*=\s*["'])(/?static/)([^"'?#]+)""")
+
+
+class Asset:
+    """A static file with its content encodings, ready to be sent"""
+
+    def __init__(self, path: str, data: bytes):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+        self.encodings = {None: data}
+        if posixpath.splitext(path)[1].lower() not in INCOMPRESSIBLE:
+            for encoding in ENCODINGS:
+                compressed = compress(data, encoding, 9)
+                if len(compressed) < len(data):
+                    self.encodings[encoding] = compressed
+
+    @property
+    def fingerprinted_path(self) -> str:
+        """Returns the path with the digest before the extension"""
+        stem, extension = posixpath.splitext(self.path)
+        return f"{stem}.{self.digest}{extension}"
+
+    def etag(self, encoding: str = None) -> str:
+        """Returns a strong ETag for one of the encodings"""
+        return f"{self.digest}-{encoding}" if encoding else self.digest
+
+
+class StaticAssets:
+    """The static files of a folder by path and by fingerprinted path"""
+
+    def __init__(self, folder: str = None):
+        self.folder = folder
+        self._assets = {}  # path -> Asset
+        self._fingerprinted = {}  # fingerprinted path -> Asset
+
+    def load(self) -> None:
+        """Reads, fingerprints and compresses every file in the folder
+
+        HTML pages are loaded last so that their static urls can be
+        rewritten to the fingerprinted paths of the files they refer to.
+        """
+        files = {}
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, self.folder).replace(os.sep, "/")
+                with open(full_path, "rb") as static_file:
+                    files[path] = static_file.read()
+
+        assets = {}
+        for path in sorted(files, key=lambda path: path.endswith(".html")):
+            data = files[path]
+            if path.endswith(".html"):
+                data = self._rewrite_urls(data.decode("utf-8"), assets).encode("utf-8")
+            assets[path] = Asset(path, data)
+        self._assets = assets
+        self._fingerprinted = {asset.fingerprinted_path: asset for asset in assets.values()}
+
+    def get(self, path: str) -> tuple:
+        """Returns the Asset for a path and if the path was fingerprinted, or (None, False)"""
+        asset = self._fingerprinted.get(path)
+        if asset is not None:
+            return asset, True
+        return self._assets.get(path), False
+
+    def url_path(self, path: str) -> str:
+        """Returns the fingerprinted path of a file, or the path if there is no such file"""
+        asset = self._assets.get(path)
+        return asset.fingerprinted_path if asset else path
+
+    ##################################################
+    # PRIVATE METHODS
+    ##################################################
+
+    @staticmethod
+    def _rewrite_urls(html: str, assets: dict) -> str:
+        """Points the static urls of a page at the fingerprinted paths"""
+
+        def replace(match):
+            asset = assets.get(match.group(3))
+            if asset is None:
+                return match.group(0)
+            return match.group(1) + match.group(2) + asset.fingerprinted_path
+
+        return STATIC_URL.sub(replace, html)
@@ -0,0 +1,200 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Module: write_coalescer
+
+Commits the single Pet writes of concurrent requests together, so that
+a burst of them waits for one commit to reach the disk instead of one
+each. A background thread takes the writes that arrive within a short
+window of the first one and runs each of them in a SAVEPOINT of its own,
+so a write that fails is rolled back alone and only its caller gets the
+error. The rest of the batch is then committed in one transaction.
+A caller that waits longer than the window and the timeout gets a
+WriteTimeoutError rather than holding its thread for good.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from prometheus_client import Histogram
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger("flask.app")
+
+BATCH_SIZE = Histogram(
+    "pet_service_write_batch_size",
+    "Writes committed together in one transaction",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+BATCH_WAIT = Histogram(
+    "pet_service_write_batch_wait_seconds",
+    "Time a write waited for its batch to start",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+BATCH_COMMIT = Histogram(
+    "pet_service_write_batch_commit_seconds",
+    "Time spent running and committing a batch of writes",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+class WriteTimeoutError(Exception):
+    """Used when a write was not committed in time"""
+
+
+class WriteCoalescer:
+    """Runs the writes of many threads on one background thread, a batch per transaction
+
+    The thread is started by the first write, so a worker forked from a
+    preloaded app starts its own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self.enabled = False
+        self.engine = None
+        self.window = 0.002
+        self.max_size = 64
+        self.timeout = 10.0
+
+    def configure(self, enabled: bool, engine, window: float, max_size: int, timeout: float = 10.0) -> None:
+        """Sets the engine to write to and how batches are filled and waited for
+
+        A batch waits up to window seconds to fill with max_size writes,
+        and its callers wait up to timeout seconds more for it to commit.
+        """
+        self.enabled = enabled
+        self.engine = engine
+        self.window = window
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+
+    def submit(self, operation):
+        """Runs operation(session) in the next batch and returns what it returned
+
+        Blocks until the batch is committed. Raises whatever the operation
+        raised, or the error that kept its batch from being committed, or
+        WriteTimeoutError if that took longer than the window and timeout.
+        """
+        self._start()
+        future = Future()
+        self._queue.put((operation, future, time.perf_counter()))
+        try:
+            return future.result(timeout=self.window + self.timeout)
+        except FutureTimeoutError:
+            # a write that has not started is never run, one that has may still be committed
+            started = not future.cancel()
+            logger.error("Write timed out after %ss, started: %s", self.window + self.timeout, started)
+            raise WriteTimeoutError(
+                "The write was not committed in time" + (" and may still be" if started else "")
+            ) from None
+
+    def stop(self, timeout: float = None) -> None:
+        """Commits the writes already submitted and stops the background thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    ##################################################
+    # PRIVATE METHODS
+    ##################################################
+
+    def _start(self) -> None:
+        """Starts the background thread unless it is running"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="write-coalescer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        """Commits batches of writes until it is stopped"""
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+            self._commit(batch)
+
+    def _collect(self) -> list:
+        """Waits for a write and returns it with the others that arrive in its window"""
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        # the window starts when the first write was submitted, so writes
+        # that queued up during the last commit do not wait any longer
+        deadline = first[2] + self.window
+        while len(batch) < self.max_size:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # stop once this batch is committed
+                break
+            batch.append(item)
+        return batch
+
+    def _commit(self, batch: list) -> None:
+        """Runs each write of a batch in a savepoint and commits them together"""
+        started = time.perf_counter()
+        BATCH_SIZE.observe(len(batch))
+        session = None
+        results = []
+        try:
+            session = Session(self.engine, expire_on_commit=False)
+            if self.engine.dialect.name == "sqlite":
+                # pysqlite only begins a transaction before INSERT, UPDATE or
+                # DELETE, so otherwise the first SAVEPOINT would begin it and
+                # releasing that savepoint would commit the write on its own
+                session.connection().exec_driver_sql("BEGIN")
+            for operation, future, submitted in batch:
+                BATCH_WAIT.observe(started - submitted)
+                # a write whose caller has given up on it is left out
+                if future.set_running_or_notify_cancel():
+                    self._write(session, operation, future, results)
+            session.commit()
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error("Could not commit a batch of %d writes: %s", len(batch), error)
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+            results = []
+        finally:
+            # the callers get their objects back detached, with the values
+            # that were written since nothing was expired by the commit
+            if session is not None:
+                session.expunge_all()
+                session.close()
+        BATCH_COMMIT.observe(time.perf_counter() - started)
+        for future, result in results:
+            future.set_result(result)
+
+    @staticmethod
+    def _write(session, operation, future: Future, results: list) -> None:
+        """Runs a write in a savepoint, its caller gets any error it raises right away"""
+        try:
+            with session.begin_nested():
+                result = operation(session)
+        except Exception as error:  # pylint: disable=broad-except
+            future.set_exception(error)
+        else:
+            results.append((future, result))
@@ -13,12 +13,13 @@
 # limitations under the License.
 
 """
-Test Factory to make fake objects for testing
+Test Factory to make fake objects for testing, and to clear them away again
 """
 from datetime import date
 import factory
 from factory.fuzzy import FuzzyChoice, FuzzyDate
-from service.models import Pet, Gender
+from service.models import db, cache, name_index, Pet, Gender
+from service.pet_stats import PetStats
 
 
 class PetFactory(factory.Factory):
@@ -35,3 +36,12 @@ class PetFactory(factory.Factory):
     available = FuzzyChoice(choices=[True, False])
     gender = FuzzyChoice(choices=[Gender.MALE, Gender.FEMALE, Gender.UNKNOWN])
     birthday = FuzzyDate(date(2008, 1, 1))
+
+
+def clear_pets():
+    """Deletes every Pet along with their counts and cached copies"""
+    db.session.query(Pet).delete()
+    db.session.query(PetStats).delete()
+    db.session.commit()
+    cache.clear()
+    name_index.clear()  # bulk deletes bypass it
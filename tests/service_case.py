@@ -0,0 +1,52 @@
+######################################################################
+# Copyright 2016, 2022 John Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Base test case for the Pet API Service Test Suites
+"""
+import logging
+import unittest
+from service import app
+from service.models import db
+from tests.factories import clear_pets
+
+
+class ServiceTestCase(unittest.TestCase):
+    """Starts every test with a test client and no Pets"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.config["TESTING"] = True
+        app.config["DEBUG"] = False
+        app.logger.setLevel(logging.CRITICAL)
+        # the service initialized the database when it was imported, and
+        # it cannot be initialized again once requests have been served
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Run once after all tests"""
+        db.session.close()
+
+    def setUp(self):
+        """Runs before each test"""
+        self.client = app.test_client()
+        clear_pets()  # clean up the last tests
+
+    def tearDown(self):
+        """Runs after each test"""
+        db.session.remove()
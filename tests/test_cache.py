@@ -0,0 +1,87 @@
+"""
+Test cases for the LRU Cache
+"""
+from unittest import TestCase
+from unittest.mock import patch
+from service.utils.cache import LRUCache
+
+
+class TestLRUCache(TestCase):
+    """Test Cases for LRUCache"""
+
+    def test_get_and_set(self):
+        """It should return cached values and count hits and misses"""
+        cache = LRUCache(max_size=2, ttl=60)
+        self.assertIsNone(cache.get(1))
+        cache.set(1, {"id": 1})
+        self.assertEqual(cache.get(1), {"id": 1})
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["size"], 1)
+
+    def test_evict_least_recently_used(self):
+        """It should evict the least recently used entry when full"""
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set(1, "one")
+        cache.set(2, "two")
+        cache.get(1)  # 2 is now the least recently used
+        cache.set(3, "three")
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(1), "one")
+        self.assertEqual(cache.get(3), "three")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    @patch("service.utils.cache.time.monotonic")
+    def test_expire_after_ttl(self, monotonic_mock):
+        """It should not return entries older than the ttl"""
+        monotonic_mock.return_value = 100.0
+        cache = LRUCache(max_size=2, ttl=10)
+        cache.set(1, "one")
+        monotonic_mock.return_value = 105.0
+        self.assertEqual(cache.get(1), "one")
+        monotonic_mock.return_value = 111.0
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_invalidate_and_clear(self):
+        """It should remove invalidated entries and clear everything"""
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set(1, "one")
+        cache.set(2, "two")
+        cache.invalidate(1)
+        cache.invalidate(99)  # missing keys are ignored
+        self.assertIsNone(cache.get(1))
+        cache.clear()
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.stats()["hits"], 0)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    @patch("service.utils.cache.time.monotonic")
+    def test_set_after_invalidate(self, monotonic_mock):
+        """It should not cache a value read before its key was invalidated"""
+        monotonic_mock.return_value = 100.0
+        cache = LRUCache(max_size=2, ttl=10)
+        cache.invalidate(1)
+        cache.set(1, "old", read_at=99.0)
+        self.assertIsNone(cache.get(1))
+        cache.set(1, "new", read_at=101.0)
+        self.assertEqual(cache.get(1), "new")
+        # invalidations are forgotten after the ttl
+        cache.invalidate(2)
+        monotonic_mock.return_value = 120.0
+        cache.invalidate(3)
+        cache.set(2, "two", read_at=99.0)
+        self.assertEqual(cache.get(2), "two")
+
+    def test_disabled_and_resized(self):
+        """It should not cache anything when the size is zero"""
+        cache = LRUCache(max_size=3, ttl=60)
+        for key in range(3):
+            cache.set(key, key)
+        cache.configure(1, 60)
+        self.assertEqual(cache.stats()["size"], 1)
+        cache.configure(0, 60)
+        cache.set(1, "one")
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats()["size"], 0)
@@ -4,7 +4,7 @@ Tests cases for Flask CLI extensions
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
-from service.utils.cli_commands import create_db
+from service.utils.cli_commands import create_db, create_indexes, init_db, rebuild_stats
 
 
 class TestFlaskCLI(TestCase):
@@ -19,3 +19,24 @@ class TestFlaskCLI(TestCase):
         db_mock.return_value = MagicMock()
         result = self.runner.invoke(create_db)
         self.assertEqual(result.exit_code, 0)
+
+    @patch('service.utils.cli_commands.create_missing_indexes')
+    def test_create_indexes(self, create_mock):
+        """It should call the create-indexes command"""
+        result = self.runner.invoke(create_indexes)
+        self.assertEqual(result.exit_code, 0)
+        create_mock.assert_called_once()
+
+    @patch('service.utils.cli_commands.create_tables')
+    def test_init_db(self, create_mock):
+        """It should call the init-db command"""
+        result = self.runner.invoke(init_db)
+        self.assertEqual(result.exit_code, 0)
+        create_mock.assert_called_once()
+
+    @patch('service.utils.cli_commands.PetStats.rebuild')
+    def test_rebuild_stats(self, rebuild_mock):
+        """It should call the rebuild-stats command"""
+        result = self.runner.invoke(rebuild_stats)
+        self.assertEqual(result.exit_code, 0)
+        rebuild_mock.assert_called_once()
@@ -0,0 +1,126 @@
+"""
+Test cases for the Gunicorn Configuration
+"""
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from service import gunicorn_conf
+from service.models import db
+
+
+def write_file(root: str, path: str, text: str) -> None:
+    """Writes a fake cgroup file"""
+    path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as cgroup_file:
+        cgroup_file.write(text)
+
+
+class TestGunicornConf(TestCase):
+    """Test Cases for the gunicorn configuration"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.root = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_cgroup_v2_limit(self):
+        """It should read the CPU quota from cgroup v2"""
+        write_file(self.root, "cpu.max", "150000 100000\n")
+        self.assertEqual(gunicorn_conf.cgroup_cpu_limit(self.root), 1.5)
+        write_file(self.root, "cpu.max", "max 100000\n")
+        self.assertIsNone(gunicorn_conf.cgroup_cpu_limit(self.root))
+
+    def test_cgroup_v1_limit(self):
+        """It should read the CPU quota from cgroup v1"""
+        write_file(self.root, "cpu/cpu.cfs_quota_us", "200000\n")
+        write_file(self.root, "cpu/cpu.cfs_period_us", "100000\n")
+        self.assertEqual(gunicorn_conf.cgroup_cpu_limit(self.root), 2.0)
+        write_file(self.root, "cpu/cpu.cfs_quota_us", "-1\n")
+        self.assertIsNone(gunicorn_conf.cgroup_cpu_limit(self.root))
+
+    def test_no_cgroup(self):
+        """It should have no limit without cgroup files"""
+        self.assertIsNone(gunicorn_conf.cgroup_cpu_limit(self.root))
+        self.assertGreaterEqual(gunicorn_conf.cpu_count(self.root), 1)
+
+    @patch("service.gunicorn_conf.os.sched_getaffinity", create=True, return_value=set(range(64)))
+    def test_cpu_count(self, _):
+        """It should round the cgroup quota up and cap it at the CPUs available"""
+        write_file(self.root, "cpu.max", "150000 100000\n")
+        self.assertEqual(gunicorn_conf.cpu_count(self.root), 2)
+        write_file(self.root, "cpu.max", "10000000 100000\n")
+        self.assertEqual(gunicorn_conf.cpu_count(self.root), 64)
+        write_file(self.root, "cpu.max", "10000 100000\n")
+        self.assertEqual(gunicorn_conf.cpu_count(self.root), 1)
+
+    def test_memory_limit(self):
+        """It should read the memory limit from cgroup v2 or v1"""
+        self.assertIsNone(gunicorn_conf.cgroup_memory_limit(self.root))
+        write_file(self.root, "memory/memory.limit_in_bytes", "9223372036854771712\n")
+        self.assertIsNone(gunicorn_conf.cgroup_memory_limit(self.root))
+        write_file(self.root, "memory/memory.limit_in_bytes", "134217728\n")
+        self.assertEqual(gunicorn_conf.cgroup_memory_limit(self.root), 134217728)
+        write_file(self.root, "memory.max", "max\n")
+        self.assertIsNone(gunicorn_conf.cgroup_memory_limit(self.root))
+        write_file(self.root, "memory.max", "268435456\n")
+        self.assertEqual(gunicorn_conf.cgroup_memory_limit(self.root), 268435456)
+
+    @patch("service.gunicorn_conf.os.sched_getaffinity", create=True, return_value=set(range(64)))
+    def test_worker_count(self, _):
+        """It should cap the workers by CPUs, the ceiling and the memory limit"""
+        self.assertEqual(gunicorn_conf.worker_count(40, 8, self.root), 8)
+        write_file(self.root, "cpu.max", "100000 100000\n")
+        self.assertEqual(gunicorn_conf.worker_count(40, 8, self.root), 3)
+        # 128Mi holds the master and two workers of 40MB
+        write_file(self.root, "memory.max", "134217728\n")
+        self.assertEqual(gunicorn_conf.worker_count(40, 8, self.root), 2)
+        # there is always at least one worker
+        self.assertEqual(gunicorn_conf.worker_count(512, 8, self.root), 1)
+
+    def test_settings(self):
+        """It should preload the app and recycle workers with jitter"""
+        self.assertGreaterEqual(gunicorn_conf.workers, 1)
+        self.assertGreaterEqual(gunicorn_conf.threads, 1)
+        self.assertTrue(gunicorn_conf.preload_app)
+        self.assertGreater(gunicorn_conf.max_requests_jitter, 0)
+
+    @patch("service.utils.log_handlers.restart_logging")
+    def test_post_fork(self, restart_mock):
+        """It should give a worker forked from a preloaded app a new pool"""
+        server = MagicMock()
+        server.cfg.preload_app = True
+        pool = db.engine.pool
+        gunicorn_conf.post_fork(server, MagicMock())
+        self.assertIsNot(db.engine.pool, pool)
+        self.assertIs(type(db.engine.pool), type(pool))
+        restart_mock.assert_called_once()
+
+        server.cfg.preload_app = False
+        pool = db.engine.pool
+        gunicorn_conf.post_fork(server, MagicMock())
+        self.assertIs(db.engine.pool, pool)
+
+    def test_on_starting(self):
+        """It should pass the metrics directory to the app and empty it on start"""
+        self.assertIn(f"PROMETHEUS_MULTIPROC_DIR={gunicorn_conf.metrics_dir}", gunicorn_conf.raw_env)
+        write_file(self.root, "counter_1234.db", "")
+        write_file(self.root, "README", "")
+        with patch.object(gunicorn_conf, "metrics_dir", self.root):
+            gunicorn_conf.on_starting(MagicMock())
+        self.assertEqual(os.listdir(self.root), ["README"])
+
+    @patch("prometheus_client.multiprocess.mark_process_dead")
+    def test_child_exit(self, mark_mock):
+        """It should mark the metrics of an exited worker as dead"""
+        worker = MagicMock(pid=1234)
+        with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": self.root}):
+            gunicorn_conf.child_exit(MagicMock(), worker)
+        mark_mock.assert_called_once_with(1234)
+        mark_mock.reset_mock()
+        with patch.dict(os.environ, clear=True):
+            gunicorn_conf.child_exit(MagicMock(), worker)
+        mark_mock.assert_not_called()
@@ -0,0 +1,123 @@
+"""
+Test cases for the Log Handlers
+"""
+import logging
+import queue
+import sys
+from unittest import TestCase
+from unittest.mock import patch
+from flask import Flask
+from service import app as service_app
+from service.utils.log_handlers import DroppingQueueHandler, RequestLogSampler, init_logging, restart_logging, stats
+
+
+def make_record(level: int, msg: str = "Pet %s", args=("fido",)) -> logging.LogRecord:
+    """Returns a log record like the ones the service writes"""
+    return logging.LogRecord("flask.app", level, __file__, 1, msg, args, None)
+
+
+class TestLogHandlers(TestCase):
+    """Test Cases for the queued log handlers"""
+
+    def test_queue_records(self):
+        """It should queue records with their message already merged"""
+        handler = DroppingQueueHandler(queue.Queue(maxsize=10))
+        handler.handle(make_record(logging.INFO))
+        record = handler.queue.get_nowait()
+        self.assertEqual(record.msg, "Pet fido")
+        self.assertIsNone(record.args)
+
+    def test_queue_exception_text(self):
+        """It should queue the text of a traceback instead of the traceback"""
+        handler = DroppingQueueHandler(queue.Queue(maxsize=10))
+        try:
+            raise ValueError("bad pet")
+        except ValueError:
+            record = make_record(logging.ERROR)
+            record.exc_info = sys.exc_info()
+        handler.handle(record)
+        queued = handler.queue.get_nowait()
+        self.assertIsNone(queued.exc_info)
+        self.assertIn("ValueError: bad pet", queued.exc_text)
+        self.assertIsNotNone(record.exc_info)  # the caller's record is left alone
+        self.assertIn("Traceback", logging.Formatter().format(queued))
+
+    def test_drop_when_full(self):
+        """It should drop and count records when the queue is full"""
+        handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+        for _ in range(3):
+            handler.handle(make_record(logging.INFO))
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(handler.dropped, 2)
+
+    def test_sample_request_logs(self):
+        """It should sample info logs in requests but keep warnings"""
+        app = Flask(__name__)
+        none_sampled = RequestLogSampler(0.0)
+        all_sampled = RequestLogSampler(1.0)
+        with app.test_request_context("/pets"):
+            self.assertFalse(none_sampled.filter(make_record(logging.INFO)))
+            self.assertTrue(none_sampled.filter(make_record(logging.WARNING)))
+        with app.test_request_context("/pets"):
+            self.assertTrue(all_sampled.filter(make_record(logging.INFO)))
+        # logs outside of a request are always kept
+        self.assertTrue(none_sampled.filter(make_record(logging.INFO)))
+
+    def test_sample_each_request(self):
+        """It should decide again for every request that the service handles"""
+        sampler = next(
+            log_filter
+            for handler in service_app.logger.handlers
+            for log_filter in handler.filters
+            if isinstance(log_filter, RequestLogSampler)
+        )
+        client = service_app.test_client()
+        level = service_app.logger.level
+        service_app.logger.setLevel(logging.INFO)
+        try:
+            with patch.object(sampler, "rate", 0.5), patch(
+                "service.utils.log_handlers.random.random", side_effect=[0.9, 0.1, 0.9]
+            ) as random_mock:
+                for _ in range(3):
+                    client.get("/")
+        finally:
+            service_app.logger.setLevel(level)
+        self.assertEqual(random_mock.call_count, 3)
+
+    def test_init_logging(self):
+        """It should write the app logs through a background listener"""
+        app = Flask(__name__)
+        app.config["LOG_QUEUE_SIZE"] = 100
+        app.config["LOG_SAMPLE_RATE"] = 1.0
+        source = logging.getLogger("test.log_handlers")
+        source.setLevel(logging.INFO)
+        target = queue.Queue()
+        source.handlers = [logging.handlers.QueueHandler(target)]
+        init_logging(app, "test.log_handlers")
+        self.assertIsInstance(app.logger.handlers[0], DroppingQueueHandler)
+        app.logger.warning("Hello %s", "world")
+        self.assertIn("Logging handler established", target.get(timeout=5).getMessage())
+        self.assertIn("[WARNING] [test_log_handlers] Hello world", target.get(timeout=5).getMessage())
+        self.assertEqual(stats(app)["dropped"], 0)
+        self.assertEqual(stats(Flask("other")), {})
+
+    def test_restart_logging(self):
+        """It should start a new listener on a new queue after a fork"""
+        app = Flask(__name__)
+        app.config["LOG_QUEUE_SIZE"] = 100
+        app.config["LOG_SAMPLE_RATE"] = 1.0
+        source = logging.getLogger("test.log_handlers.restart")
+        source.setLevel(logging.INFO)
+        target = queue.Queue()
+        source.handlers = [logging.handlers.QueueHandler(target)]
+        init_logging(app, "test.log_handlers.restart")
+        handler = app.logger.handlers[0]
+        old_queue, old_listener = handler.queue, handler.listener
+        old_listener.stop()  # a forked worker has no listener thread
+        restart_logging(app)
+        self.assertIsNot(handler.queue, old_queue)
+        self.assertIsNot(handler.listener, old_listener)
+        self.assertEqual(handler.queue.maxsize, 100)
+        target.get(timeout=5)  # Logging handler established
+        app.logger.warning("After %s", "fork")
+        self.assertIn("After fork", target.get(timeout=5).getMessage())
@@ -0,0 +1,100 @@
+"""
+Test cases for the in-process Name Index
+"""
+import threading
+import time
+from unittest import TestCase
+from service.utils.name_index import NameIndex, trigrams
+
+ROWS = [(1, "Fido"), (2, "fifi"), (3, "Felix"), (4, "Fido"), (5, "Rex"), (6, "Kitty")]
+
+
+class TestNameIndex(TestCase):
+    """Test Cases for NameIndex"""
+
+    def setUp(self):
+        self.index = NameIndex(ttl=0)
+        self.index.rebuild(ROWS)
+
+    def test_trigrams(self):
+        """It should make trigrams the way pg_trgm does"""
+        self.assertEqual(trigrams("Cat"), {"  c", " ca", "cat", "at "})
+        self.assertEqual(trigrams("a-b"), {"  a", " a ", "  b", " b "})
+        self.assertEqual(trigrams(""), set())
+
+    def test_prefix(self):
+        """It should find names by prefix ordered by name and id"""
+        self.assertEqual(list(self.index.prefix("fi")), [1, 4, 2])
+        self.assertEqual(list(self.index.prefix("F")), [3, 1, 4, 2])
+        self.assertEqual(list(self.index.prefix("fido")), [1, 4])
+        self.assertEqual(list(self.index.prefix("z")), [])
+
+    def test_fuzzy(self):
+        """It should rank names by trigram similarity"""
+        self.assertEqual(list(self.index.fuzzy("fido")), [1, 4])
+        self.assertEqual(list(self.index.fuzzy("kity")), [6])
+        self.assertEqual(list(self.index.fuzzy("fidoo"))[:2], [1, 4])
+        self.assertEqual(list(self.index.fuzzy("zzz")), [])
+        # a lower threshold lets in weaker matches, ranked after the best
+        self.assertEqual(list(self.index.fuzzy("fido", threshold=0.1))[:2], [1, 4])
+        self.assertIn(2, list(self.index.fuzzy("fido", threshold=0.1)))
+
+    def test_update(self):
+        """It should move ids between names"""
+        self.index.update(7, new_name="Fiona")
+        self.index.update(1, "Fido", "Rover")
+        self.index.update(5, "Rex")
+        self.assertEqual(list(self.index.prefix("fi")), [4, 2, 7])
+        self.assertEqual(list(self.index.prefix("r")), [1])
+        self.assertEqual(list(self.index.fuzzy("rex")), [])
+        self.assertEqual(list(self.index.fuzzy("rover")), [1])
+
+    def test_update_before_rebuild(self):
+        """It should ignore updates until it is built"""
+        index = NameIndex()
+        index.update(1, new_name="Fido")
+        self.assertTrue(index.is_stale())
+        self.assertEqual(list(index.prefix("f")), [])
+
+    def test_staleness(self):
+        """It should be stale when cleared or older than the ttl"""
+        self.assertFalse(self.index.is_stale())  # a ttl of 0 never expires
+        self.index.configure(0.01)
+        time.sleep(0.02)
+        self.assertTrue(self.index.is_stale())
+        self.index.rebuild(ROWS)
+        self.assertFalse(self.index.is_stale())
+        self.index.clear()
+        self.assertTrue(self.index.is_stale())
+        self.assertEqual(list(self.index.prefix("f")), [])
+
+    def test_refresh(self):
+        """It should only load the names when it is stale"""
+        index = NameIndex(ttl=0)
+        index.refresh(lambda: ROWS)
+        self.assertEqual(list(index.prefix("fi")), [1, 4, 2])
+        index.refresh(self.fail)  # not stale, so nothing is loaded
+
+    def test_refresh_serves_stale(self):
+        """It should keep using the stale index while another thread rebuilds it"""
+        self.index.configure(0.01)
+        time.sleep(0.02)
+        loading = threading.Event()
+        loaded = threading.Event()
+
+        def load():
+            loading.set()
+            loaded.wait(5)
+            return [(7, "Fiona")]
+
+        thread = threading.Thread(target=self.index.refresh, args=(load,))
+        thread.start()
+        self.assertTrue(loading.wait(5))
+        self.index.refresh(self.fail)  # does not load the names again
+        self.assertEqual(list(self.index.prefix("fi")), [1, 4, 2])
+        # a change made during the rebuild is kept once it is done
+        self.index.update(8, new_name="Fifo")
+        loaded.set()
+        thread.join()
+        self.assertEqual(list(self.index.prefix("fi")), [8, 7])
+        self.assertFalse(self.index.is_stale())
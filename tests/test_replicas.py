@@ -0,0 +1,52 @@
+"""
+Test cases for the ReplicaRouter
+"""
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from sqlalchemy import exc
+from service.utils.replicas import ReplicaRouter
+
+
+class TestReplicaRouter(TestCase):
+    """Test Cases for ReplicaRouter"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.router = ReplicaRouter()
+        uris = [f"sqlite:///{self.tmp_dir.name}/{name}.db" for name in ["one", "two"]]
+        self.router.configure(uris, {}, eject_seconds=10)
+
+    def tearDown(self):
+        self.router.dispose()
+        self.tmp_dir.cleanup()
+
+    def test_round_robin(self):
+        """It should take turns between the replicas"""
+        one, two = self.router.engines[0], self.router.engines[1]
+        self.assertEqual([self.router.choose() for _ in range(4)], [one, two, one, two])
+        self.assertEqual([replica["reads"] for replica in self.router.stats()], [2, 2])
+
+    @patch("service.utils.replicas.time.monotonic")
+    def test_eject(self, monotonic_mock):
+        """It should leave out an ejected replica until it may be tried again"""
+        monotonic_mock.return_value = 100.0
+        one, two = self.router.engines[0], self.router.engines[1]
+        self.router.eject(one)
+        self.assertEqual([self.router.choose() for _ in range(3)], [two, two, two])
+        self.router.eject(two)
+        self.assertIsNone(self.router.choose())
+        self.assertEqual([replica["healthy"] for replica in self.router.stats()], [False, False])
+
+        monotonic_mock.return_value = 111.0
+        self.assertEqual({self.router.choose() for _ in range(2)}, {one, two})
+        self.assertEqual([replica["ejections"] for replica in self.router.stats()], [1, 1])
+
+    def test_eject_on_connection_error(self):
+        """It should eject a replica that cannot be connected to"""
+        self.router.configure(["sqlite:////no/such/dir/replica.db"], {}, eject_seconds=10)
+        engine = self.router.choose()
+        with self.assertRaises(exc.OperationalError):
+            engine.connect()
+        self.assertIsNone(self.router.choose())
+        self.assertFalse(self.router.stats()[0]["healthy"])
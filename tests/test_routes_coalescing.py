@@ -0,0 +1,75 @@
+######################################################################
+# Copyright 2016, 2022 John Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Pet API Service Test Suite for writes that go through the write coalescer
+"""
+from unittest.mock import patch
+from service.utils import status
+from service.models import db, writes, Pet
+from service.pet_stats import PetStats
+from service.utils.write_coalescer import WriteTimeoutError
+from tests.factories import PetFactory
+from tests.service_case import ServiceTestCase
+
+BASE_URL = "/pets"
+
+
+######################################################################
+#  T E S T   W R I T E   C O A L E S C I N G
+######################################################################
+class TestCoalescedWrites(ServiceTestCase):
+    """Pet Server Tests with the write coalescer enabled"""
+
+    def setUp(self):
+        """Runs before each test"""
+        super().setUp()
+        writes.configure(True, db.engine, 0.002, 64)
+
+    def tearDown(self):
+        """Runs after each test"""
+        writes.stop()
+        writes.configure(False, db.engine, 0.002, 64)
+        super().tearDown()
+
+    def test_coalesced_writes(self):
+        """It should Create, Update, Purchase and Delete a Pet through the write coalescer"""
+        response = self.client.post(BASE_URL, json=PetFactory(available=True).serialize())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        pet = response.get_json()
+        pet["name"] = "Changed"
+        response = self.client.put(f"{BASE_URL}/{pet['id']}", json=pet, headers={"If-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["name"], "Changed")
+
+        # the old version is rejected as it would be without coalescing
+        response = self.client.put(f"{BASE_URL}/{pet['id']}", json=pet, headers={"If-Match": '"stale"'})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        response = self.client.put(f"{BASE_URL}/{pet['id']}/purchase")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.get_json()["available"])
+        response = self.client.delete(f"{BASE_URL}/{pet['id']}")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Pet.query.count(), 0)
+        self.assertEqual(PetStats.all(), [])
+
+    def test_write_timeout(self):
+        """It should answer a write that is not committed in time with 503"""
+        with patch.object(writes, "submit", side_effect=WriteTimeoutError("The write was not committed in time")):
+            response = self.client.post(BASE_URL, json=PetFactory().serialize())
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.get_json()["error"], "Service Unavailable")
@@ -0,0 +1,140 @@
+######################################################################
+# Copyright 2016, 2022 John Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Pet API Service Test Suite for reads that go to read replicas
+"""
+import tempfile
+from datetime import date
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from service import app
+from service.utils import status
+from service.models import db, cache, replicas, Pet, Gender
+from service.utils.replicas import STICKY_COOKIE
+from tests.factories import PetFactory
+from tests.service_case import ServiceTestCase
+
+BASE_URL = "/pets"
+
+
+######################################################################
+#  T E S T   R E A D   R E P L I C A S
+######################################################################
+class TestReplicaReads(ServiceTestCase):
+    """Pet Server Tests with a read replica"""
+
+    ######################################################################
+    #  U T I L I T Y   F U N C T I O N S
+    ######################################################################
+
+    def _use_replica(self, uri=None):
+        """Sends the reads of GET requests to a replica until the test ends
+
+        The replica is a separate SQLite file that is not replicated, so a
+        read that finds data only the replica has shows it was routed there.
+        """
+        if uri is None:
+            tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+            self.addCleanup(tmp_dir.cleanup)
+            uri = f"sqlite:///{tmp_dir.name}/replica.db"
+        app.config["DATABASE_REPLICA_URIS"] = [uri]
+        replicas.configure([uri], {}, app.config["REPLICA_EJECT_SECONDS"])
+        self.addCleanup(replicas.configure, [], {}, app.config["REPLICA_EJECT_SECONDS"])
+        self.addCleanup(app.config.update, DATABASE_REPLICA_URIS=[])
+        return replicas.engines[0]
+
+    def _forget_session(self):
+        """Starts the next request with an empty session and cache, as a new worker would"""
+        db.session.remove()
+        cache.clear()
+
+    ######################################################################
+    #  T E S T   C A S E S
+    ######################################################################
+
+    def test_reads_go_to_replica(self):
+        """It should read from the replica and write to the primary"""
+        replica = self._use_replica()
+        db.metadata.create_all(replica)
+        row = {"name": "Replica", "category": "dog", "available": True, "gender": Gender.MALE, "version": 1}
+        with replica.begin() as connection:
+            replica_id = connection.execute(insert(Pet).values(**row).returning(Pet.id)).scalar()
+
+        response = self.client.get(f"{BASE_URL}/{replica_id}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["name"], "Replica")
+        self.assertEqual([pet["name"] for pet in self.client.get(BASE_URL).get_json()], ["Replica"])
+        self.assertEqual(Pet.query.count(), 0)  # the primary never had it
+
+        response = self.client.post(BASE_URL, json=PetFactory().serialize())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Pet.query.count(), 1)
+
+        stats = self.client.get("/stats/replicas").get_json()["replicas"]
+        self.assertEqual(stats[0]["reads"], 2)
+        self.assertTrue(stats[0]["healthy"])
+
+    def test_read_your_writes(self):
+        """It should read from the primary for a while after a client wrote"""
+        db.metadata.create_all(self._use_replica())
+        response = self.client.post(BASE_URL, json=PetFactory().serialize())
+        self.assertIn(STICKY_COOKIE, response.headers["Set-Cookie"])
+        pet_id = response.get_json()["id"]
+        self._forget_session()
+        self.assertEqual(self.client.get(f"{BASE_URL}/{pet_id}").status_code, status.HTTP_200_OK)
+        self._forget_session()
+
+        # another client reads from the replica, which is behind
+        other = app.test_client()
+        self.assertEqual(other.get(f"{BASE_URL}/{pet_id}").status_code, status.HTTP_404_NOT_FOUND)
+
+        # once the window has passed the client reads from the replica again
+        self.client.set_cookie(STICKY_COOKIE, "0")
+        self.assertEqual(self.client.get(f"{BASE_URL}/{pet_id}").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_replica_reads_are_not_cached(self):
+        """It should not cache a Pet read from a replica that a client who wrote would then get"""
+        replica = self._use_replica()
+        db.metadata.create_all(replica)
+        response = self.client.post(BASE_URL, json=PetFactory(name="Fresh").serialize())
+        pet = response.get_json()
+        with replica.begin() as connection:
+            row = dict(pet, name="Stale", gender=Gender[pet["gender"]], birthday=date.fromisoformat(pet["birthday"]))
+            connection.execute(insert(Pet).values(version=1, **row))
+        self._forget_session()
+
+        other = app.test_client()
+        self.assertEqual(other.get(f"{BASE_URL}/{pet['id']}").get_json()["name"], "Stale")
+        self.assertIsNone(cache.get(pet["id"]))
+        db.session.remove()
+        self.assertEqual(self.client.get(f"{BASE_URL}/{pet['id']}").get_json()["name"], "Fresh")
+
+        # a client that just wrote does not read the cache either
+        cache.set(pet["id"], dict(pet, name="Cached", version=1))
+        self.assertEqual(self.client.get(f"{BASE_URL}/{pet['id']}").get_json()["name"], "Fresh")
+
+    def test_failed_replica_is_ejected(self):
+        """It should read from the primary once the only replica has failed"""
+        self._use_replica("sqlite:////no/such/dir/replica.db")
+        pet = PetFactory()
+        pet.create()
+        self._forget_session()
+        with self.assertRaises(OperationalError):
+            self.client.get(f"{BASE_URL}/{pet.id}")
+        db.session.remove()
+        self.assertEqual(self.client.get(f"{BASE_URL}/{pet.id}").status_code, status.HTTP_200_OK)
+        self.assertFalse(self.client.get("/stats/replicas").get_json()["replicas"][0]["healthy"])
@@ -0,0 +1,67 @@
+"""
+Test cases for the declarative Schemas
+"""
+from datetime import date
+from enum import Enum
+from unittest import TestCase
+from service.utils.schema import Schema, String, Boolean, Choice, Date, format_errors
+
+
+class Color(Enum):
+    """Enum used to test Choice fields"""
+
+    RED = 0
+    BLUE = 1
+
+
+SCHEMA = Schema(
+    name=String(max_length=5),
+    active=Boolean(),
+    color=Choice(Color),
+    since=Date(),
+)
+
+VALID = {"name": "fido", "active": True, "color": "RED", "since": "2022-01-31"}
+
+
+class TestSchema(TestCase):
+    """Test Cases for Schema"""
+
+    def test_validate(self):
+        """It should convert a valid payload"""
+        values, errors = SCHEMA.validate(dict(VALID, extra="ignored"))
+        self.assertEqual(errors, {})
+        self.assertEqual(
+            values, {"name": "fido", "active": True, "color": Color.RED, "since": date(2022, 1, 31)}
+        )
+
+    def test_validate_collects_every_error(self):
+        """It should report every invalid field instead of the first one"""
+        data = {"name": "too long", "active": "true", "color": "red", "since": 20220131}
+        values, errors = SCHEMA.validate(data)
+        self.assertEqual(values, {})
+        self.assertEqual(set(errors), {"name", "active", "color", "since"})
+        self.assertIn("at most 5", errors["name"])
+        self.assertIn("RED, BLUE", errors["color"])
+
+    def test_validate_missing_fields(self):
+        """It should report missing fields"""
+        _, errors = SCHEMA.validate({"name": "fido", "color": ["RED"]})
+        self.assertEqual(errors["active"], "is missing")
+        self.assertEqual(errors["since"], "is missing")
+        self.assertIn("color", errors)
+        self.assertEqual(format_errors({"active": "is missing"}), "active is missing")
+
+    def test_validate_not_a_dict(self):
+        """It should report a payload that is not an object"""
+        for data in [None, "fido", [VALID]]:
+            values, errors = SCHEMA.validate(data)
+            self.assertEqual(values, {})
+            self.assertEqual(list(errors), ["body"])
+
+    def test_validate_many(self):
+        """It should validate a list of payloads in one pass"""
+        valid, invalid = SCHEMA.validate_many([VALID, None, VALID, dict(VALID, active=1)])
+        self.assertEqual(len(valid), 2)
+        self.assertEqual([index for index, _ in invalid], [1, 3])
+        self.assertEqual(list(invalid[1][1]), ["active"])
@@ -0,0 +1,67 @@
+"""
+Test cases for the Static Assets and response compression
+"""
+import gzip
+import os
+import tempfile
+from unittest import TestCase
+from service.utils.compression import ENCODINGS, compress
+from service.utils.static_assets import StaticAssets
+
+CSS = b"body { color: blue; }\n" * 100
+PAGE = """<link rel="stylesheet" href="static/css/site.css">
+<img src="/static/images/logo.png"><script src='static/js/missing.js'></script>"""
+
+
+class TestStaticAssets(TestCase):
+    """Test Cases for StaticAssets"""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        for path, data in [
+            ("css/site.css", CSS),
+            ("images/logo.png", os.urandom(200)),
+            ("index.html", PAGE.encode()),
+        ]:
+            full_path = os.path.join(self.folder.name, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "wb") as static_file:
+                static_file.write(data)
+        self.assets = StaticAssets(self.folder.name)
+        self.assets.load()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_fingerprint(self):
+        """It should find a file by its path and by its fingerprinted path"""
+        asset, fingerprinted = self.assets.get("css/site.css")
+        self.assertFalse(fingerprinted)
+        self.assertEqual(asset.mimetype, "text/css")
+        url_path = self.assets.url_path("css/site.css")
+        self.assertRegex(url_path, r"^css/site\.[0-9a-f]{12}\.css$")
+        self.assertEqual(self.assets.get(url_path), (asset, True))
+        self.assertEqual(self.assets.get("css/other.css"), (None, False))
+        self.assertEqual(self.assets.url_path("css/other.css"), "css/other.css")
+
+    def test_precompressed(self):
+        """It should compress every encoding ahead of time except for images"""
+        asset, _ = self.assets.get("css/site.css")
+        self.assertEqual(set(asset.encodings), {None, *ENCODINGS})
+        self.assertEqual(gzip.decompress(asset.encodings["gzip"]), CSS)
+        self.assertNotEqual(asset.etag("gzip"), asset.etag())
+        logo, _ = self.assets.get("images/logo.png")
+        self.assertEqual(list(logo.encodings), [None])
+
+    def test_rewrite_urls(self):
+        """It should point the static urls of HTML pages at the fingerprinted paths"""
+        page = self.assets.get("index.html")[0].encodings[None].decode()
+        self.assertIn(f'href="static/{self.assets.url_path("css/site.css")}"', page)
+        self.assertIn(f'src="/static/{self.assets.url_path("images/logo.png")}"', page)
+        self.assertIn("src='static/js/missing.js'", page)
+
+    def test_compress(self):
+        """It should compress the same data to the same bytes every time"""
+        for encoding in ENCODINGS:
+            self.assertEqual(compress(CSS, encoding, 6), compress(CSS, encoding, 6))
+            self.assertLess(len(compress(CSS, encoding, 6)), len(CSS))
@@ -0,0 +1,121 @@
+"""
+Test cases for the WriteCoalescer
+"""
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+from prometheus_client import REGISTRY
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, exc, select
+from service.utils.write_coalescer import WriteCoalescer, WriteTimeoutError
+
+metadata = MetaData()
+items = Table(
+    "items",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String(63), nullable=False, unique=True),
+)
+
+
+def batch_count() -> tuple:
+    """Returns the number of batches and of writes committed in them so far"""
+    return (
+        REGISTRY.get_sample_value("pet_service_write_batch_size_count"),
+        REGISTRY.get_sample_value("pet_service_write_batch_size_sum"),
+    )
+
+
+class TestWriteCoalescer(TestCase):
+    """Test Cases for WriteCoalescer"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.engine = create_engine(f"sqlite:///{self.tmp_dir.name}/writes.db")
+        metadata.create_all(self.engine)
+        self.writes = WriteCoalescer()
+        # a long window so that every write of a test lands in one batch
+        self.writes.configure(True, self.engine, window=0.25, max_size=4)
+
+    def tearDown(self):
+        self.writes.stop()
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def _submit_all(self, operations: list) -> list:
+        """Submits the operations from a thread each and returns what each of them got"""
+        outcomes = [None] * len(operations)
+
+        def submit(index, operation):
+            try:
+                outcomes[index] = self.writes.submit(operation)
+            except Exception as error:  # pylint: disable=broad-except
+                outcomes[index] = error
+
+        threads = [threading.Thread(target=submit, args=item) for item in enumerate(operations)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def _names(self) -> list:
+        with self.engine.connect() as connection:
+            return sorted(connection.execute(select(items.c.name)).scalars())
+
+    @staticmethod
+    def insert(name: str):
+        """Returns an operation that inserts an item and returns its id"""
+        return lambda session: session.execute(items.insert().values(name=name)).inserted_primary_key[0]
+
+    def test_batch(self):
+        """It should commit concurrent writes together and give each caller its own result"""
+        batches, writes = batch_count()
+        outcomes = self._submit_all([self.insert(name) for name in ["a", "b", "c"]])
+        self.assertEqual(sorted(outcomes), [1, 2, 3])
+        self.assertEqual(self._names(), ["a", "b", "c"])
+        self.assertEqual(batch_count(), (batches + 1, writes + 3))
+
+    def test_max_size(self):
+        """It should not put more than max_size writes in a batch"""
+        batches, writes = batch_count()
+        self._submit_all([self.insert(str(number)) for number in range(6)])
+        self.assertEqual(len(self._names()), 6)
+        self.assertEqual(batch_count(), (batches + 2, writes + 6))
+
+    def test_failed_write(self):
+        """It should roll back a write that failed without its batch"""
+        outcomes = self._submit_all([self.insert("a"), self.insert("a"), self.insert("b")])
+        errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], exc.IntegrityError)
+        self.assertEqual(self._names(), ["a", "b"])
+
+    def test_failed_batch(self):
+        """It should give every caller the error that kept their batch from committing"""
+        self.writes.configure(True, create_engine("sqlite:////no/such/dir/writes.db"), window=0.25, max_size=4)
+        outcomes = self._submit_all([self.insert("a"), self.insert("b")])
+        for outcome in outcomes:
+            self.assertIsInstance(outcome, exc.OperationalError)
+
+    def test_timeout(self):
+        """It should give up on a write that is not committed in time and never run it"""
+        self.writes.configure(True, self.engine, window=0, max_size=4, timeout=0.1)
+        blocker = threading.Event()
+        with patch.object(self.writes, "_commit", side_effect=lambda batch: blocker.wait()):
+            with self.assertRaises(WriteTimeoutError):
+                self.writes.submit(self.insert("a"))
+        # the writer is still stuck on the first batch, so this write times
+        # out before it starts and is skipped once the writer gets to it
+        with self.assertRaises(WriteTimeoutError):
+            self.writes.submit(self.insert("b"))
+        blocker.set()
+        self.writes.stop()
+        self.assertEqual(self._names(), [])
+
+    def test_stop(self):
+        """It should start the writer thread again after it was stopped"""
+        self.writes.window = 0
+        self.assertEqual(self.writes.submit(self.insert("a")), 1)
+        self.writes.stop()
+        self.assertEqual(self.writes.submit(self.insert("b")), 2)